@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import USER_TOKENS_VERSION, get_version, is_cache_shared
+
+TOKEN_KEY = 'auth:token:{digest}'
+
+
+class TokenCache:
+    """
+    Ограниченный по размеру LRU-кеш в памяти процесса. Записи устаревают
+    через `timeout` секунд.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE,
+                         settings.TOKEN_CACHE_TIMEOUT)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который кеширует пользователя по токену, чтобы не
+    обращаться к таблице токенов при каждом запросе.
+    Значения полей пользователя хранятся в памяти процесса (TokenCache),
+    а при TOKEN_CACHE_SHARED - еще и в общем кеше Django, вместе с версией
+    USER_TOKENS_VERSION пользователя. Версия сбрасывается при удалении
+    токена (выход через auth/token/logout) и при изменении пользователя
+    (в том числе смене пароля), поэтому устаревают только записи этого
+    пользователя.
+    Без общего кеша Django (is_cache_shared) смена версии не видна другим
+    процессам, поэтому кеш не используется и токен проверяется по базе.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_cache_shared():
+            return super().authenticate_credentials(key)
+        digest = sha256(key.encode()).hexdigest()
+        item = token_cache.get(digest)
+        if item is None and settings.TOKEN_CACHE_SHARED:
+            item = cache.get(TOKEN_KEY.format(digest=digest))
+            if item is not None:
+                token_cache.set(digest, item)
+        if item is not None:
+            user_id, version, values = item
+            if version == get_version(USER_TOKENS_VERSION.format(pk=user_id)):
+                return self.build_credentials(key, values)
+        else:
+            user_id = self.get_model().objects.filter(key=key).values_list(
+                'user_id', flat=True).first()
+            if user_id is None:
+                return super().authenticate_credentials(key)
+        # Версия читается до загрузки пользователя: если он изменится
+        # между этими запросами, запись сразу окажется устаревшей
+        version = get_version(USER_TOKENS_VERSION.format(pk=user_id))
+        user, token = super().authenticate_credentials(key)
+        item = (user.pk, version, tuple(
+            getattr(user, field.attname)
+            for field in user._meta.concrete_fields
+        ))
+        token_cache.set(digest, item)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(TOKEN_KEY.format(digest=digest), item,
+                      settings.TOKEN_CACHE_TIMEOUT)
+        return user, token
+
+    def build_credentials(self, key, values):
+        """Создает пользователя и токен из закешированных значений полей."""
+        model = self.get_model()
+        user_model = model._meta.get_field('user').related_model
+        user = user_model.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in user_model._meta.concrete_fields],
+            values,
+        )
+        return user, model(key=key, user=user)
@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+# Сигналы пакетного добавления и удаления связей пользователя (избранное,
+# список покупок, подписки). Отправляются один раз на пакет с аргументами
+# user_id и ids (id рецептов или авторов) вместо post_save/post_delete
+# для каждой связи.
+relations_added = Signal()
+relations_removed = Signal()
+
+
+def lock_user_relations(user):
+    """
+    Блокирует строку пользователя `user` до конца текущей транзакции.
+    Связи пользователя (пакетно и по одной) меняются под этой блокировкой,
+    поэтому прочитанные под ней связи не изменятся параллельным запросом
+    до фиксации транзакции.
+    """
+    list(get_user_model().objects.select_for_update().filter(
+        pk=user.pk).values_list('pk', flat=True))
+
+
+def delete_relations(model, field, user_id, ids):
+    """
+    Удаляет связи `model` пользователя с объектами `ids` одним DELETE без
+    загрузки объектов и сигналов post_delete для каждой связи.
+    Возвращает количество удаленных строк.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {quote(meta.get_field("user").column)} = %s '
+            f'AND {quote(meta.get_field(field).column)} IN ({placeholders})',
+            [user_id, *ids],
+        )
+        return cursor.rowcount
+
+
+def apply_batch(model, field, user, targets, add=(), remove=(),
+                forbidden=()):
+    """
+    Добавляет связи пользователя `user` с объектами `add` и удаляет связи
+    с объектами `remove` в одной транзакции. `model` - модель связи с
+    полями user и `field` (id рецепта или автора), `targets` - queryset
+    объектов, на которые могут ссылаться связи, `forbidden` - id, связь с
+    которыми запрещена.
+    Количество запросов не зависит от размера пакета: связи создаются
+    одним bulk_create, удаляются одним DELETE без загрузки объектов,
+    а вместо сигналов для каждой связи отправляются relations_added и
+    relations_removed. Существующие связи читаются под блокировкой
+    lock_user_relations, поэтому параллельные запросы того же пользователя
+    не учитываются в счетчиках дважды.
+    Возвращает список {'id', 'action', 'status'} в порядке запроса.
+    """
+    ids = set(add) | set(remove)
+    relations = model.objects.filter(user=user)
+    with transaction.atomic():
+        lock_user_relations(user)
+        found = set(targets.filter(pk__in=ids).values_list('pk', flat=True))
+        existing = set(relations.filter(**{f'{field}__in': ids}).values_list(
+            field, flat=True))
+        created = [pk for pk in add if pk in found
+                   and pk not in existing and pk not in forbidden]
+        deleted = [pk for pk in remove if pk in existing]
+        if created:
+            model.objects.bulk_create(
+                (model(user=user, **{field: pk}) for pk in created),
+                ignore_conflicts=True,
+            )
+            relations_added.send(sender=model, user_id=user.pk, ids=created)
+        if deleted:
+            delete_relations(model, field, user.pk, deleted)
+            relations_removed.send(sender=model, user_id=user.pk, ids=deleted)
+    results = []
+    for pk in add:
+        if pk not in found:
+            result = 'not_found'
+        elif pk in forbidden:
+            result = 'forbidden'
+        elif pk in existing:
+            result = 'exists'
+        else:
+            result = 'created'
+        results.append({'id': pk, 'action': 'add', 'status': result})
+    for pk in remove:
+        results.append({
+            'id': pk,
+            'action': 'remove',
+            'status': 'deleted' if pk in existing else 'not_found',
+        })
+    return results
@@ -0,0 +1,434 @@
+import time
+from calendar import timegm
+from collections import namedtuple
+from hashlib import md5
+from threading import Lock
+from types import MappingProxyType
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from django.http import Http404
+from rest_framework.response import Response
+
+from recipes.models import Ingredient, Recipe, Tag
+from .renderers import FastJSONRenderer, JSONFragment
+from .representations import represent_recipes
+from .serializers import IngredientSerializer, TagSerializer, get_subscriptions
+
+RECIPES_LIST_VERSION = 'recipes:list:version'
+RECIPE_VERSION = 'recipes:version:{pk}'
+RECIPE_BODY = 'recipes:body:{pk}:{version}:{host}'
+TAGS_VERSION = 'tags:version'
+INGREDIENTS_VERSION = 'ingredients:version'
+USER_FLAGS_VERSION = 'users:flags:version:{pk}'
+USER_TOKENS_VERSION = 'auth:tokens:version:{pk}'
+CACHE_HITS = 'recipes:hits'
+CACHE_MISSES = 'recipes:misses'
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_version(key):
+    """
+    Возвращает текущую версию из кеша. Если версии нет (в том числе после
+    вытеснения), создается новая, поэтому старые записи не используются.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """Возвращает версии для нескольких ключей за одно обращение к кешу."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(key)
+    return versions
+
+
+def bump_version(key):
+    cache.set(key, uuid4().hex, None)
+
+
+def invalidate_version(key):
+    """Сбрасывает версию `key` после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def invalidate_recipes(recipe_ids):
+    """
+    Сбрасывает закешированные ответы для рецептов `recipe_ids` и все
+    закешированные списки рецептов после фиксации транзакции.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    def invalidate():
+        bump_version(RECIPES_LIST_VERSION)
+        for pk in recipe_ids:
+            bump_version(RECIPE_VERSION.format(pk=pk))
+
+    transaction.on_commit(invalidate)
+
+
+def is_cache_shared():
+    """
+    Общий ли кеш у процессов приложения. Версии в LocMemCache видны только
+    своему процессу, поэтому сброс версии не доходит до других воркеров и
+    до команд управления.
+    """
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+class ProcessSnapshot:
+    """
+    Данные, загруженные в память процесса. Перед использованием версия
+    снимка сверяется с версией в общем кеше, поэтому изменения, сделанные
+    в других процессах, подхватываются при следующем обращении. Если кеш
+    не общий (см. is_cache_shared), изменения из других процессов
+    подхватываются по истечении `timeout` секунд (по умолчанию -
+    SNAPSHOT_TIMEOUT).
+    """
+
+    def __init__(self, version_key, loader, timeout=None):
+        self.version_key = version_key
+        self.loader = loader
+        self.timeout = (
+            settings.SNAPSHOT_TIMEOUT if timeout is None else timeout)
+        self.version = None
+        self.data = None
+        self.loaded_at = 0
+        self.lock = Lock()
+
+    def is_stale(self, version):
+        return version != self.version or (
+            time.monotonic() - self.loaded_at > self.timeout)
+
+    def get(self):
+        version = get_version(self.version_key)
+        if self.is_stale(version):
+            with self.lock:
+                if self.is_stale(version):
+                    self.data = self.loader()
+                    self.version = version
+                    self.loaded_at = time.monotonic()
+        return self.data
+
+    def reset(self):
+        """Сбрасывает снимок в текущем процессе."""
+        with self.lock:
+            self.version = None
+            self.data = None
+
+    def invalidate(self):
+        """Сбрасывает снимок во всех процессах после фиксации транзакции."""
+        invalidate_version(self.version_key)
+
+
+tag_table = ProcessSnapshot(
+    TAGS_VERSION, lambda: dict(Tag.objects.values_list('slug', 'id'))
+)
+
+SerializedTable = namedtuple('SerializedTable', ('items', 'body'))
+
+
+def serialize_table(queryset, serializer_class):
+    """
+    Сериализует таблицу в JSON: каждую строку отдельно (словарь по id) и
+    весь список целиком. Список собирается из готовых строк.
+    """
+    renderer = FastJSONRenderer()
+    items = {
+        item['id']: renderer.render(item)
+        for item in serializer_class(queryset, many=True).data
+    }
+    return SerializedTable(
+        MappingProxyType(items), b'[' + b','.join(items.values()) + b']'
+    )
+
+
+tags_snapshot = ProcessSnapshot(
+    TAGS_VERSION, lambda: serialize_table(Tag.objects.all(), TagSerializer)
+)
+ingredients_snapshot = ProcessSnapshot(
+    INGREDIENTS_VERSION,
+    lambda: serialize_table(Ingredient.objects.all(), IngredientSerializer),
+)
+
+
+class ConditionalMixin:
+    """
+    Условные GET-запросы для действий из `conditional_actions`.
+    ETag и Last-Modified вычисляются методами get_etag и get_last_modified
+    по версиям данных в кеше, без загрузки и сериализации объектов.
+    Если клиент прислал совпадающие If-None-Match или If-Modified-Since,
+    возвращается 304.
+    Версии сбрасываются в других процессах только через общий кеш, поэтому
+    без него (is_cache_shared) ETag не отдается и не проверяется, остается
+    только Last-Modified по данным из базы.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return view(request, *args, **kwargs)
+        etag = None
+        if is_cache_shared():
+            etag = self.get_etag(request, *args, **kwargs)
+        etag = quote_etag(etag) if etag else None
+        last_modified = self.get_last_modified(request, *args, **kwargs)
+        if last_modified is not None:
+            last_modified = timegm(last_modified.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        if etag:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class SnapshotMixin:
+    """
+    Отдает list и retrieve из готового снимка таблицы `snapshot`
+    (ProcessSnapshot с SerializedTable) без запросов к базе данных и
+    сериализаторов: готовый JSON передается рендереру как JSONFragment.
+    """
+    snapshot = None
+
+    def get_snapshot_ids(self, request):
+        """id строк для ответа list или None, если нужна вся таблица."""
+        return None
+
+    def snapshot_response(self, body):
+        return Response(JSONFragment(body))
+
+    def list(self, request, *args, **kwargs):
+        table = self.snapshot.get()
+        ids = self.get_snapshot_ids(request)
+        if ids is None:
+            return self.snapshot_response(table.body)
+        return self.snapshot_response(b'[' + b','.join(
+            table.items[pk] for pk in ids if pk in table.items) + b']')
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        body = self.snapshot.get().items.get(
+            int(pk) if str(pk).isdigit() else None)
+        if body is None:
+            raise Http404
+        return self.snapshot_response(body)
+
+
+def _count(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def get_cache_stats():
+    """Количество попаданий и промахов кеша ответов с рецептами."""
+    stats = cache.get_many((CACHE_HITS, CACHE_MISSES))
+    return {
+        'hits': stats.get(CACHE_HITS, 0),
+        'misses': stats.get(CACHE_MISSES, 0),
+    }
+
+
+class RecipeCacheMixin:
+    """
+    Кеширует ответы list и retrieve для рецептов.
+    Для анонимных пользователей ответ не зависит от пользователя и
+    кешируется целиком в виде готового JSON (JSONFragment) по полному
+    адресу запроса.
+    Для авторизованных пользователей кешируется общее представление каждого
+    рецепта, а признаки is_favorited, is_in_shopping_cart и is_subscribed
+    накладываются поверх по трем множествам id, загруженным один раз.
+    Версии в ключах сбрасываются сигналами при изменении рецептов, их
+    ингредиентов и тегов. Сброс виден другим процессам только через общий
+    кеш, поэтому без него (is_cache_shared) ответы не кешируются.
+    Представления рецептов собираются функцией represent_recipes в обход
+    полей RecipeSerializer.
+    """
+    cache_query_params = ('tags', 'tags_mode', 'author', 'page', 'limit',
+                          'cursor', 'ordering')
+
+    def get_list_cache_key(self, request):
+        """
+        Ключ по полному адресу запроса: ссылки next и previous в ответе
+        повторяют схему, хост и параметры запроса. Запросы с параметрами не
+        из cache_query_params не кешируются (None).
+        """
+        if set(request.query_params) - set(self.cache_query_params):
+            return None
+        digest = md5(request.build_absolute_uri().encode()).hexdigest()
+        return f'recipes:list:{get_version(RECIPES_LIST_VERSION)}:{digest}'
+
+    def get_detail_cache_key(self, request, pk):
+        version = get_version(RECIPE_VERSION.format(pk=pk))
+        digest = md5(request.build_absolute_uri('/').encode()).hexdigest()
+        return f'recipes:detail:{pk}:{version}:{digest}'
+
+    def cached_response(self, key, view, request, *args, **kwargs):
+        if key is None:
+            return view(request, *args, **kwargs)
+        data = cache.get(key)
+        if data is not None:
+            _count(CACHE_HITS)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        _count(CACHE_MISSES)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.data = JSONFragment(
+                FastJSONRenderer().render(response.data))
+            cache.set(key, response.data, settings.RECIPE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def get_recipe_bodies(self, request, recipe_ids):
+        """
+        Возвращает общие представления рецептов в порядке `recipe_ids`.
+        Отсутствующие в кеше рецепты загружаются одним запросом, без общего
+        кеша загружаются все рецепты.
+        """
+        if not is_cache_shared():
+            return represent_recipes(
+                recipe_ids, {**self.get_serializer_context(),
+                             'subscriptions': set()})
+        host = md5(repr((
+            request.build_absolute_uri('/'),
+            self.get_serializer_context().get('image_width'),
+        )).encode()).hexdigest()
+        versions = get_versions(
+            [RECIPE_VERSION.format(pk=pk) for pk in recipe_ids]
+        )
+        keys = {
+            pk: RECIPE_BODY.format(
+                pk=pk, version=versions[RECIPE_VERSION.format(pk=pk)],
+                host=host,
+            )
+            for pk in recipe_ids
+        }
+        cached = cache.get_many(keys.values())
+        bodies = {pk: cached[key] for pk, key in keys.items() if key in cached}
+        missing = [pk for pk in recipe_ids if pk not in bodies]
+        if bodies:
+            _count(CACHE_HITS, len(bodies))
+        if missing:
+            fresh = {
+                body['id']: body for body in represent_recipes(
+                    missing, {**self.get_serializer_context(),
+                              'subscriptions': set()})
+            }
+            cache.set_many(
+                {keys[pk]: body for pk, body in fresh.items()},
+                settings.RECIPE_CACHE_TIMEOUT,
+            )
+            _count(CACHE_MISSES, len(missing))
+            bodies.update(fresh)
+        return [bodies[pk] for pk in recipe_ids if pk in bodies]
+
+    def overlay_user_flags(self, request, bodies):
+        """Накладывает признаки текущего пользователя на представления."""
+        recipe_ids = [body['id'] for body in bodies]
+        favorites = set(request.user.favorite.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+        shopping_cart = set(request.user.shopping_cart.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+        subscriptions = get_subscriptions(self.get_serializer_context())
+        data = []
+        for body in bodies:
+            body = dict(body)
+            body['author'] = dict(
+                body['author'],
+                is_subscribed=body['author']['id'] in subscriptions,
+            )
+            body['is_favorited'] = body['id'] in favorites
+            body['is_in_shopping_cart'] = body['id'] in shopping_cart
+            data.append(body)
+        return data
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated and is_cache_shared():
+            return self.cached_response(
+                self.get_list_cache_key(request), self.list_recipes, request
+            )
+        return self.list_recipes(request)
+
+    def list_recipes(self, request):
+        # Признаки is_favorited и is_in_shopping_cart накладываются
+        # отдельными запросами (overlay_user_flags), поэтому страница
+        # выбирается без аннотаций и связанных объектов get_queryset
+        queryset = self.filter_queryset(Recipe.objects.all())
+        ordering = (
+            field.lstrip('-') for field in queryset.query.order_by
+            if field.lstrip('-') not in queryset.query.annotations
+        )
+        queryset = queryset.only('id', 'pub_date', *ordering)
+        page = self.paginate_queryset(queryset)
+        recipes = page if page is not None else queryset
+        data = self.get_recipe_bodies(
+            request, [recipe.pk for recipe in recipes])
+        if request.user.is_authenticated:
+            data = self.overlay_user_flags(request, data)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if not str(pk).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        if not request.user.is_authenticated and is_cache_shared():
+            return self.cached_response(
+                self.get_detail_cache_key(request, int(pk)),
+                self.retrieve_recipe, request, int(pk)
+            )
+        return self.retrieve_recipe(request, int(pk))
+
+    def retrieve_recipe(self, request, pk):
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'author_id'), pk=pk)
+        self.check_object_permissions(request, recipe)
+        data = self.get_recipe_bodies(request, [recipe.pk])
+        if request.user.is_authenticated:
+            data = self.overlay_user_flags(request, data)
+        return Response(data[0])
@@ -1,47 +1,113 @@
+from django.conf import settings
+from django.db.models import (BooleanField, Case, Count, Exists, F,
+                              OuterRef, Value, When)
 from django_filters import FilterSet, filters
 
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
 from users.models import User
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingCart
+from .cache import tag_table
+from .params import (RECIPE_ORDERING_CHOICES, RECIPE_ORDERINGS,
+                     TAGS_MODE_CHOICES)
+from .search import get_ingredient_trie
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """
+    Поиск ингредиентов по вхождению в название. Ингредиенты, название
+    которых начинается с искомой строки, выводятся первыми.
+    В режиме INGREDIENT_SEARCH_BACKEND = 'trie' поиск выполняется по
+    префиксному дереву в памяти процесса без обращения к базе данных.
+    """
     search_param = 'name'
 
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term or getattr(view, 'action', None) != 'list':
+            return queryset
+        if settings.INGREDIENT_SEARCH_BACKEND == 'trie':
+            return get_ingredient_trie().search(term)
+        return queryset.filter(name__icontains=term).annotate(
+            is_substring=Case(
+                When(name__istartswith=term, then=Value(False)),
+                default=Value(True),
+                output_field=BooleanField(),
+            )
+        ).order_by('is_substring', 'name')
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in tag_table.get()]
 
 
 class RecipeFilterSet(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODE_CHOICES,
+        method='get_tags_mode',
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=RECIPE_ORDERING_CHOICES,
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'tags_mode', 'author', 'is_favorited',
+                  'is_in_shopping_cart', 'ordering')
+
+    def get_tags(self, queryset, name, value):
+        """
+        Фильтрует рецепты по тегам полусоединением по таблице связей, без
+        JOIN и дублирования строк. В режиме `tags_mode=all` рецепт должен
+        иметь все указанные теги, по умолчанию - хотя бы один.
+        """
+        table = tag_table.get()
+        tag_ids = {table[slug] for slug in value if slug in table}
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            return queryset.filter(pk__in=recipe_tags.values(
+                'recipe_id').annotate(count=Count('tag_id')).filter(
+                count=len(tag_ids)).values('recipe_id'))
+        return queryset.filter(
+            Exists(recipe_tags.filter(recipe_id=OuterRef('pk')))
+        )
+
+    def get_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def get_ordering(self, queryset, name, value):
+        """
+        Сортировка `favorited` выводит только избранные рецепты текущего
+        пользователя, начиная с последних добавленных. Рецепты читаются
+        через соединение с его записями избранного в порядке индекса
+        (user, -date_added).
+        """
+        if value == 'favorited':
+            if not self.request.user.is_authenticated:
+                return queryset
+            queryset = queryset.filter(
+                favorite__user=self.request.user
+            ).annotate(favorited_at=F('favorite__date_added'))
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
 
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(
-                favorite__user=self.request.user,
-                is_favorited=True,
-            )
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk'))))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(
-                shopping_cart__user=self.request.user,
-                is_in_shopping_cart=True,
-            )
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=self.request.user, recipe_id=OuterRef('pk'))))
         return queryset
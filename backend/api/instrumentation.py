@@ -0,0 +1,239 @@
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .params import QUERY_BUDGETS
+
+logger = logging.getLogger(__name__)
+
+# Списки параметров IN (%s, %s, ...) разной длины считаются одним запросом
+IN_PARAMS = re.compile(r'\((?:%s, )*%s\)')
+
+_recorder = ContextVar('query_recorder', default=None)
+
+
+class QueryRecorder:
+    """
+    Считает SQL-запросы, время их выполнения и время работы
+    представлений без SQL (ViewTimingMixin).
+    Одинаковые по форме запросы (текст без значений параметров)
+    группируются, чтобы находить повторы вида N+1.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.view_time = 0.0
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.count += 1
+            shape = IN_PARAMS.sub('(...)', sql)
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, threshold=None):
+        """Запросы, повторенные не меньше QUERY_REPEAT_THRESHOLD раз."""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        return {
+            shape: count for shape, count in self.shapes.items()
+            if count >= threshold
+        }
+
+    @contextmanager
+    def record(self):
+        token = _recorder.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield self
+        finally:
+            _recorder.reset(token)
+
+
+class ViewTimingMixin:
+    """
+    Учитывает в текущем QueryRecorder время работы представления DRF без
+    SQL-запросов: проверку прав, разбор запроса и сериализацию ответа.
+    Подключается к представлениям явно; без QueryBudgetMiddleware (то есть
+    при выключенном QUERY_INSTRUMENTATION) ничего не делает.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        recorder = _recorder.get()
+        if recorder is not None:
+            request.view_timing = (time.perf_counter(), recorder.db_time)
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        recorder = _recorder.get()
+        timing = getattr(request, 'view_timing', None)
+        if recorder is not None and timing is not None:
+            started, db_time = timing
+            recorder.view_time += (time.perf_counter() - started) - (
+                recorder.db_time - db_time)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class QueryStats:
+    """Статистика запросов по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = Lock()
+
+    def add(self, name, recorder, total_time):
+        repeated = recorder.repeated()
+        budget = QUERY_BUDGETS.get(name)
+        with self.lock:
+            item = self.views.setdefault(name, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time': 0.0,
+                'view_time': 0.0,
+                'total_time': 0.0,
+                'repeated_queries': 0,
+                'over_budget': 0,
+                'budget': budget,
+            })
+            item['requests'] += 1
+            item['queries'] += recorder.count
+            item['max_queries'] = max(item['max_queries'], recorder.count)
+            item['db_time'] += recorder.db_time
+            item['view_time'] += recorder.view_time
+            item['total_time'] += total_time
+            item['repeated_queries'] += bool(repeated)
+            item['over_budget'] += budget is not None and (
+                recorder.count > budget)
+
+    def get(self):
+        """Средние значения по представлениям, время в миллисекундах."""
+        with self.lock:
+            views = {name: dict(item) for name, item in self.views.items()}
+        result = []
+        for name, item in views.items():
+            requests = item['requests']
+            result.append({
+                'view': name,
+                'requests': requests,
+                'avg_queries': round(item['queries'] / requests, 1),
+                'max_queries': item['max_queries'],
+                'budget': item['budget'],
+                'over_budget': item['over_budget'],
+                'repeated_queries': item['repeated_queries'],
+                'avg_db_ms': round(item['db_time'] * 1000 / requests, 2),
+                'avg_view_ms': round(
+                    item['view_time'] * 1000 / requests, 2),
+                'avg_total_ms': round(
+                    item['total_time'] * 1000 / requests, 2),
+            })
+        return sorted(result, key=lambda item: -item['avg_total_ms'])
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+query_stats = QueryStats()
+
+
+def get_view_name(view_func, method):
+    """Имя представления вида RecipeViewSet.list или UsersViewSet.me."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    method = method.lower()
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class QueryBudgetMiddleware:
+    """
+    Измеряет для каждого запроса количество и время SQL-запросов, время
+    работы представления без SQL (ViewTimingMixin) и общее время,
+    добавляет их в заголовки Server-Timing и X-Query-Count и в статистику
+    query_stats. Повторяющиеся запросы
+    (возможные N+1) и превышение QUERY_BUDGETS пишутся в лог, количество
+    повторов - в заголовок X-Query-Repeats.
+    Включается настройкой QUERY_INSTRUMENTATION.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.record():
+            response = self.get_response(request)
+        total_time = time.perf_counter() - started
+        name = getattr(request, 'query_budget_view', None)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={recorder.db_time * 1000:.1f};'
+            f'desc="{recorder.count} queries"',
+            f'view;dur={recorder.view_time * 1000:.1f}',
+            f'total;dur={total_time * 1000:.1f}',
+        ))
+        response['X-Query-Count'] = str(recorder.count)
+        repeated = recorder.repeated()
+        if repeated:
+            response['X-Query-Repeats'] = str(max(repeated.values()))
+            logger.warning(
+                'Повторяющиеся запросы в %s: %s', name or request.path,
+                '; '.join(f'{count} x {shape}'
+                          for shape, count in repeated.items()),
+            )
+        if name is None:
+            return response
+        budget = QUERY_BUDGETS.get(name)
+        if budget is not None and recorder.count > budget:
+            logger.warning('%s: %s запросов при бюджете %s',
+                           name, recorder.count, budget)
+        query_stats.add(name, recorder, total_time)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget_view = get_view_name(view_func, request.method)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """
+    Проверяет, что код внутри блока выполняет не больше `limit` SQL-запросов.
+    Для тестов:
+        with assert_max_queries(5):
+            client.get('/api/recipes/')
+    """
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    if recorder.count > limit:
+        shapes = '\n'.join(
+            f'{count} x {shape}'
+            for shape, count in sorted(recorder.shapes.items(),
+                                       key=lambda item: -item[1])
+        )
+        raise AssertionError(
+            f'Выполнено {recorder.count} запросов, допустимо {limit}:\n'
+            f'{shapes}'
+        )
+
+
+def assert_query_budget(view_name):
+    """Как assert_max_queries, но с лимитом из QUERY_BUDGETS[view_name]."""
+    return assert_max_queries(QUERY_BUDGETS[view_name])
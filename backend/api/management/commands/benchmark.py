@@ -0,0 +1,207 @@
+import json
+import math
+import time
+import tracemalloc
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from rest_framework.authtoken.models import Token
+
+from api.instrumentation import QueryRecorder
+from api.params import PAGE_SIZE
+from recipes.models import Favorite, Ingredient, Recipe
+from users.models import User
+
+REPEAT = 50
+WARMUP = 5
+# Допустимое ухудшение p95 относительно базовой линии, в процентах
+THRESHOLD = 20
+# Меньшие изменения времени считаются шумом измерений
+MIN_DELTA_MS = 1
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    index = max(math.ceil(percent / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+class Command(BaseCommand):
+    """
+    Измеряет время ответа основных эндпоинтов API (p50 и p95), количество
+    SQL-запросов и пиковое потребление памяти на запрос.
+    Результат можно сохранить в JSON (--output) и сравнить с сохраненной
+    ранее базовой линией (--baseline): команда завершается с ошибкой, если
+    p95 ухудшился больше чем на --threshold процентов или выросло
+    количество запросов.
+    Для содержательных результатов база заполняется командой
+    generate_data.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=REPEAT,
+                            help='Количество измерений каждого эндпоинта')
+        parser.add_argument('--warmup', type=int, default=WARMUP,
+                            help='Количество запросов для прогрева')
+        parser.add_argument('--user',
+                            help='Логин пользователя для запросов с '
+                                 'авторизацией (по умолчанию - первый '
+                                 'пользователь с избранным)')
+        parser.add_argument('--only', nargs='+', metavar='NAME',
+                            help='Измерять только указанные эндпоинты')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument('--baseline',
+                            help='Сравнить с результатом из JSON-файла')
+        parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                            help='Допустимое ухудшение p95, в процентах')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        self.cold = options['cold']
+        scenarios = self.get_scenarios(self.get_user(options['user']))
+        if options['only']:
+            unknown = set(options['only']) - {name for name, *_ in scenarios}
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios
+                         if scenario[0] in options['only']]
+        results = {}
+        for name, client, path in scenarios:
+            results[name] = self.measure(
+                client, path, options['warmup'], options['repeat'])
+            self.report(name, results[name])
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'repeat': options['repeat'],
+            'cold': self.cold,
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(options['baseline'], results, options['threshold'])
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден')
+            return user
+        user_id = Favorite.objects.order_by('user_id').values_list(
+            'user_id', flat=True).first()
+        user = User.objects.filter(pk=user_id).first() or (
+            User.objects.order_by('pk').first())
+        if user is None:
+            raise CommandError('В базе нет пользователей, выполните '
+                               'generate_data')
+        return user
+
+    def get_scenarios(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        anonymous = Client()
+        authorized = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        count = recipes.count()
+        deep_page = max(count // PAGE_SIZE // 2, 1)
+        recipe_id = recipes.values_list('pk', flat=True)[count // 2:][:1]
+        recipe_id = recipe_id[0] if recipe_id else 0
+        ingredient = Ingredient.objects.order_by('pk').values_list(
+            'name', flat=True).first() or ''
+        next_page = anonymous.get('/api/recipes/?cursor=').json().get('next')
+        cursor_path = next_page.split('testserver', 1)[-1] if next_page else (
+            '/api/recipes/?cursor=')
+        return (
+            ('recipes', anonymous, '/api/recipes/'),
+            ('recipes_authorized', authorized, '/api/recipes/'),
+            ('recipes_deep_page', anonymous,
+             f'/api/recipes/?page={deep_page}'),
+            ('recipes_cursor', anonymous, cursor_path),
+            ('recipes_favorited', authorized, '/api/recipes/?is_favorited=1'),
+            ('recipe_detail', authorized, f'/api/recipes/{recipe_id}/'),
+            ('tags', anonymous, '/api/tags/'),
+            ('ingredients_search', anonymous,
+             f'/api/ingredients/?name={ingredient[:3]}'),
+            ('subscriptions', authorized, '/api/users/subscriptions/'),
+            ('download_shopping_cart', authorized,
+             '/api/recipes/download_shopping_cart/'),
+        )
+
+    def request(self, client, path):
+        if self.cold:
+            cache.clear()
+        response = client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, client, path, warmup, repeat):
+        for _ in range(warmup):
+            response = self.request(client, path)
+        timings = []
+        recorder = QueryRecorder()
+        for _ in range(repeat):
+            started = time.perf_counter()
+            with recorder.record():
+                response = self.request(client, path)
+            timings.append(time.perf_counter() - started)
+        # tracemalloc сильно замедляет выполнение, поэтому память
+        # измеряется отдельным запросом
+        tracemalloc.start()
+        try:
+            self.request(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'queries': round(recorder.count / max(repeat, 1), 1),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result):
+        line = (f'{name:<24} p50 {result["p50_ms"]:>8.2f} мс  '
+                f'p95 {result["p95_ms"]:>8.2f} мс  '
+                f'запросов {result["queries"]:>5}  '
+                f'память {result["peak_memory_kb"]:>8.1f} КБ')
+        if result['status'] != 200:
+            line = self.style.WARNING(f'{line}  статус {result["status"]}')
+        self.stdout.write(line)
+
+    def compare(self, path, results, threshold):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        regressions = []
+        self.stdout.write(f'\nСравнение с {path}:')
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (result['p95_ms'] / previous['p95_ms'] - 1) * 100 if (
+                previous['p95_ms']) else 0
+            line = (f'{name:<24} p95 {previous["p95_ms"]:.2f} -> '
+                    f'{result["p95_ms"]:.2f} мс ({change:+.0f}%), '
+                    f'запросов {previous["queries"]} -> {result["queries"]}')
+            slower = change > threshold and (
+                result['p95_ms'] - previous['p95_ms'] > MIN_DELTA_MS)
+            if slower or result['queries'] > previous['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(
+                f'Ухудшение производительности: {", ".join(regressions)}')
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.images import build_image_variants, get_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Строит уменьшенные копии фото рецептов, для которых их еще нет
+    (например, загруженных до появления обработки фото).
+    С ключом --force копии строятся заново для всех рецептов.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Построить копии заново для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants').order_by('pk')
+        processed = 0
+        for recipe in recipes.iterator():
+            if not options['force'] and get_image_variants(recipe):
+                continue
+            if options['force']:
+                Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+            build_image_variants(recipe.pk)
+            processed += 1
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Обработано фото: {processed} за {elapsed:.2f} с'
+        )
@@ -0,0 +1,64 @@
+import os
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.images import VARIANTS_PATH, is_file_referenced
+from recipes.models import Recipe
+from recipes.storage import lock_file_name
+
+
+class Command(BaseCommand):
+    """
+    Удаляет из хранилища фото рецептов файлы, на которые не ссылается ни
+    один рецепт: ни как на фото, ни как на его уменьшенную копию.
+    Перед удалением ссылки на файл проверяются еще раз под lock_file_name:
+    файл, записанный или переиспользованный рецептом, который еще
+    сохраняется, не удаляется, так как блокировка снимается только после
+    фиксации рецепта. Без PostgreSQL блокировок нет, и команду следует
+    запускать, когда фото рецептов не загружаются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, которые будут удалены',
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        referenced = set()
+        for name, variants in Recipe.objects.exclude(image='').values_list(
+                'image', 'image_variants').iterator():
+            referenced.add(name)
+            referenced.update((variants or {}).get('widths', {}).values())
+        removed = size = 0
+        for directory in (field.upload_to, VARIANTS_PATH):
+            for name in self.walk(storage, directory.rstrip('/')):
+                if name in referenced:
+                    continue
+                with transaction.atomic():
+                    lock_file_name(name)
+                    if is_file_referenced(name):
+                        continue
+                    removed += 1
+                    size += storage.size(name)
+                    if options['dry_run']:
+                        self.stdout.write(name)
+                    else:
+                        storage.delete(name)
+        self.stdout.write(
+            f'{"Будет удалено" if options["dry_run"] else "Удалено"} '
+            f'файлов: {removed} ({size / 2 ** 20:.1f} МБ)'
+        )
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, os.path.join(directory, name))
@@ -0,0 +1,222 @@
+import random
+import time
+from array import array
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.utils import timezone
+
+from api.cache import (INGREDIENTS_VERSION, RECIPES_LIST_VERSION,
+                       TAGS_VERSION, bump_version)
+from api.params import MAX_COOKING_TIME, MIN_COOKING_TIME
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+BATCH_SIZE = 5000
+# Размер пачки bulk_update: каждая пачка - один UPDATE с CASE по всем строкам
+UPDATE_BATCH_SIZE = 1000
+USERNAME_PREFIX = 'bench'
+PASSWORD = 'bench-password'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+# Разброс дат публикации рецептов и добавления в избранное, корзины и
+# подписки
+PUBLICATION_PERIOD = timedelta(days=365)
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу данных синтетическими данными для бенчмарков:
+    пользователи, рецепты с ингредиентами и тегами, избранное, корзины и
+    подписки. Строки вставляются пачками через bulk_create, поэтому
+    сигналы не срабатывают; денормализованные данные (счетчики, списки
+    покупок, показатели популярности) пересчитываются в конце служебными
+    командами. Пользователи создаются с логинами bench<N> и паролем
+    bench-password.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000,
+                            help='Количество пользователей')
+        parser.add_argument('--recipes', type=int, default=1_000_000,
+                            help='Количество рецептов')
+        parser.add_argument('--ingredients-per-recipe', type=int,
+                            default=10,
+                            help='Количество ингредиентов в рецепте')
+        parser.add_argument('--favorites-per-user', type=int, default=20,
+                            help='Количество рецептов в избранном')
+        parser.add_argument('--cart-per-user', type=int, default=5,
+                            help='Количество рецептов в списке покупок')
+        parser.add_argument('--follows-per-user', type=int, default=10,
+                            help='Количество подписок пользователя')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Количество строк в одной пачке')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Начальное значение генератора случайных '
+                                 'чисел')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        started = time.monotonic()
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['ingredients_per_recipe']:
+            raise CommandError(
+                'Недостаточно ингредиентов, сначала выполните import_data')
+        tag_ids = self.create_tags()
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(user_ids, options['recipes'])
+        self.create_recipe_rows(recipe_ids, ingredient_ids, tag_ids,
+                                options['ingredients_per_recipe'])
+        for model, per_user in ((Favorite, options['favorites_per_user']),
+                                (ShoppingCart, options['cart_per_user'])):
+            self.create_user_rows(model, 'recipe_id', 'date_added',
+                                  user_ids, recipe_ids, per_user)
+        self.create_user_rows(
+            Follow, 'author_id', 'date_add', user_ids, user_ids,
+            options['follows_per_user'])
+        self.log('Пересчет денормализованных данных')
+        call_command('repair_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('update_recipe_scores', stdout=self.stdout)
+        for key in (RECIPES_LIST_VERSION, TAGS_VERSION, INGREDIENTS_VERSION):
+            bump_version(key)
+        self.log(f'Готово за {time.monotonic() - started:.0f} с')
+
+    def log(self, message):
+        self.stdout.write(message)
+        self.stdout.flush()
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def insert(self, model, rows, total, label=None, **kwargs):
+        """Вставляет строки генератора `rows` пачками по batch_size."""
+        label = label or model._meta.verbose_name_plural
+        batch = []
+        inserted = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch, **kwargs)
+                inserted += len(batch)
+                batch = []
+                self.stdout.write(
+                    f'\r{label}: {inserted} из ~{total}', ending='')
+        if batch:
+            model.objects.bulk_create(batch, **kwargs)
+            inserted += len(batch)
+        self.log(f'\r{label}: {inserted}')
+
+    def create_users(self, count):
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX).count()
+        password = make_password(PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'{USERNAME_PREFIX}{number}',
+                email=f'{USERNAME_PREFIX}{number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(start, start + count)
+        ), count)
+        return array('q', User.objects.filter(
+            username__startswith=USERNAME_PREFIX).order_by('pk')
+            .values_list('pk', flat=True).iterator())
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+    def spread_dates(self, model, field, after_pk, label=None):
+        """
+        Задает строкам `model` с pk больше `after_pk` случайные даты `field`
+        за последние PUBLICATION_PERIOD. Поле заполняется автоматически
+        (auto_now_add), поэтому даты задаются после вставки через
+        bulk_update.
+        """
+        label = label or model._meta.verbose_name_plural
+        ids = array('q', model.objects.filter(pk__gt=after_pk).order_by(
+            'pk').values_list('pk', flat=True).iterator())
+        start = self.now - PUBLICATION_PERIOD
+        seconds = PUBLICATION_PERIOD.total_seconds()
+        for number in range(0, len(ids), UPDATE_BATCH_SIZE):
+            model.objects.bulk_update(
+                [
+                    model(pk=pk, **{field: start + timedelta(
+                        seconds=self.random.uniform(0, seconds))})
+                    for pk in ids[number:number + UPDATE_BATCH_SIZE]
+                ],
+                (field,),
+            )
+            self.stdout.write(
+                f'\r{label}, даты: '
+                f'{min(number + UPDATE_BATCH_SIZE, len(ids))} '
+                f'из {len(ids)}', ending='')
+        self.log(f'\r{label}, даты: {len(ids)}')
+        return ids
+
+    def create_recipes(self, user_ids, count):
+        """
+        Создает рецепты со случайной датой публикации у каждого рецепта.
+        """
+        first_id = self.last_pk(Recipe)
+        self.insert(Recipe, (
+            Recipe(
+                author_id=self.random.choice(user_ids),
+                name=f'Рецепт {number}',
+                text='Описание рецепта ' * self.random.randint(1, 20),
+                cooking_time=self.random.randint(
+                    MIN_COOKING_TIME, min(MAX_COOKING_TIME, 180)),
+            )
+            for number in range(count)
+        ), count)
+        return self.spread_dates(Recipe, 'pub_date', first_id)
+
+    def create_recipe_rows(self, recipe_ids, ingredient_ids, tag_ids,
+                           per_recipe):
+        self.insert(IngredientAmount, (
+            IngredientAmount(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=self.random.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(ingredient_ids,
+                                                    per_recipe)
+        ), len(recipe_ids) * per_recipe)
+        through = Recipe.tags.through
+        self.insert(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(
+                tag_ids, self.random.randint(1, min(2, len(tag_ids))))
+        ), len(recipe_ids), label='Теги рецептов')
+
+    def create_user_rows(self, model, field, date_field, user_ids,
+                         target_ids, per_user):
+        """
+        Создает для каждого пользователя `per_user` связей `model` со
+        случайными объектами из `target_ids` (без связей с самим собой)
+        и случайной датой `date_field` у каждой связи.
+        """
+        per_user = min(per_user, len(target_ids) - 1)
+        first_id = self.last_pk(model)
+        self.insert(model, (
+            model(user_id=user_id, **{field: target_id})
+            for user_id in user_ids
+            for target_id in set(
+                self.random.choice(target_ids) for _ in range(per_user))
+            if target_id != user_id or model is not Follow
+        ), len(user_ids) * per_user, ignore_conflicts=True)
+        self.spread_dates(model, date_field, first_id)
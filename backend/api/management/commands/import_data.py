@@ -1,24 +1,254 @@
+import csv
+import io
+import json
 import os
-from csv import reader
+import sys
+import time
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import INGREDIENTS_VERSION, bump_version
 from recipes.models import Ingredient
 
 DATA_PATH = os.path.join(settings.BASE_DIR, 'data')
 INGREDIENTS_DATA = os.path.join(DATA_PATH, 'ingredients.csv')
+FORMATS = ('csv', 'json', 'jsonl')
+BATCH_SIZE = 1000
+# Размер блока, которым читается JSON
+JSON_CHUNK_SIZE = 64 * 1024
 
 
 class Command(BaseCommand):
-    """Импортирует данные из .csv в базу данных"""
-
-    def handle(self, *args, **kwargs):
-        with open(INGREDIENTS_DATA, 'r', encoding='UTF-8') as ingredients:
-            for fields in reader(ingredients):
-                if len(fields) == 2:
-                    name, measurement_unit = fields
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit,
-                    )
+    """
+    Импортирует ингредиенты из .csv, .json (массив объектов) или .jsonl
+    (объект в каждой строке) в базу данных. Строки читаются потоком и
+    вставляются пачками, уже существующие ингредиенты пропускаются.
+    Повторный запуск ничего не меняет.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=[INGREDIENTS_DATA],
+            help='Файлы с ингредиентами, "-" - стандартный ввод',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат данных (по умолчанию - по расширению файла, '
+                 'для стандартного ввода - csv)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество строк в одной пачке',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загружать через COPY во временную таблицу '
+                 '(только PostgreSQL)',
+        )
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только для PostgreSQL')
+        load = self.copy_rows if options['copy'] else self.insert_rows
+        for path in options['paths']:
+            data_format = options['format'] or self.detect_format(path)
+            started = time.monotonic()
+            with self.open(path) as file:
+                rows = self.read_rows(file, data_format)
+                total, inserted = load(rows, options['batch_size'])
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{"stdin" if path == "-" else path}: '
+                f'прочитано {total}, добавлено {inserted}, '
+                f'пропущено {total - inserted} '
+                f'за {elapsed:.2f} с ({total / (elapsed or 1e-9):.0f} строк/с)'
+            )
+        bump_version(INGREDIENTS_VERSION)
         self.stdout.write('Данные успешно импортированы')
+
+    @staticmethod
+    def detect_format(path):
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if path == '-':
+            return 'csv'
+        if extension not in FORMATS:
+            raise CommandError(
+                f'Не удалось определить формат файла {path}, '
+                'укажите --format'
+            )
+        return extension
+
+    @staticmethod
+    @contextmanager
+    def open(path):
+        if path == '-':
+            # Обертка отсоединяется от sys.stdin.buffer, а не закрывает его
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='UTF-8')
+            try:
+                yield file
+            finally:
+                file.detach()
+            return
+        try:
+            file = open(path, 'r', encoding='UTF-8')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+        with file:
+            yield file
+
+    @staticmethod
+    def read_json_array(file):
+        """
+        Отдает объекты из JSON-массива по одному, читая файл блоками по
+        JSON_CHUNK_SIZE символов, без загрузки всего массива в память.
+        """
+        decoder = json.JSONDecoder()
+        chunks = iter(partial(file.read, JSON_CHUNK_SIZE), '')
+        buffer, position = '', 0
+
+        def next_char():
+            """Следующий непробельный символ, '' в конце файла."""
+            nonlocal buffer, position
+            while True:
+                while (position < len(buffer)
+                       and buffer[position].isspace()):
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                chunk = next(chunks, '')
+                if not chunk:
+                    return ''
+                buffer, position = chunk, 0
+
+        if next_char() != '[':
+            raise CommandError('JSON должен быть массивом объектов')
+        position += 1
+        if next_char() == ']':
+            return
+        while True:
+            if position > JSON_CHUNK_SIZE:
+                buffer, position = buffer[position:], 0
+            # Объект, обрезанный концом блока, дочитывается следующим блоком
+            while True:
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                    break
+                except json.JSONDecodeError as error:
+                    chunk = next(chunks, '')
+                    if not chunk:
+                        raise CommandError(f'Ошибка в JSON: {error}')
+                    buffer += chunk
+            if not isinstance(record, dict):
+                raise CommandError('JSON должен быть массивом объектов')
+            yield record
+            char = next_char()
+            if char == ']':
+                return
+            if char != ',':
+                raise CommandError('Ошибка в JSON: ожидается "," или "]"')
+            position += 1
+            next_char()
+
+    @staticmethod
+    def read_json_lines(file):
+        """Отдает объекты из файла JSON Lines (по объекту в строке)."""
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise CommandError(f'Ошибка в строке {number}: {error}')
+            if not isinstance(record, dict):
+                raise CommandError(
+                    f'Ошибка в строке {number}: ожидается объект')
+            yield record
+
+    @classmethod
+    def read_rows(cls, file, data_format):
+        """Отдает пары (название, единица измерения) с непустыми полями."""
+        if data_format in ('json', 'jsonl'):
+            if data_format == 'json':
+                records = cls.read_json_array(file)
+            else:
+                records = cls.read_json_lines(file)
+            records = (
+                (record.get('name'), record.get('measurement_unit'))
+                for record in records
+            )
+        else:
+            records = (fields for fields in csv.reader(file)
+                       if len(fields) == 2)
+        for name, measurement_unit in records:
+            name = (name or '').strip()
+            measurement_unit = (measurement_unit or '').strip()
+            if name and measurement_unit:
+                yield name, measurement_unit
+
+    @staticmethod
+    def batches(rows, batch_size):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def insert_rows(self, rows, batch_size):
+        """
+        Вставляет строки через bulk_create, пропуская нарушения
+        ограничения unique_ingredient.
+        """
+        total = 0
+        count_before = Ingredient.objects.count()
+        with transaction.atomic():
+            for batch in self.batches(rows, batch_size):
+                total += len(batch)
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=measurement_unit)
+                     for name, measurement_unit in batch),
+                    ignore_conflicts=True,
+                )
+        return total, Ingredient.objects.count() - count_before
+
+    def copy_rows(self, rows, batch_size):
+        """
+        Загружает строки командой COPY во временную таблицу и переносит
+        новые ингредиенты одним INSERT ... ON CONFLICT DO NOTHING.
+        """
+        total = 0
+        table = Ingredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(150), measurement_unit varchar(150)) '
+                'ON COMMIT DROP'
+            )
+            for batch in self.batches(rows, batch_size):
+                total += len(batch)
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            inserted = cursor.rowcount
+        return total, inserted
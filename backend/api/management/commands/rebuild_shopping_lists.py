@@ -0,0 +1,87 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает списки покупок пользователей по содержимому корзин.
+    Пользователи обрабатываются пачками по возрастанию id, каждая пачка -
+    в отдельной транзакции, поэтому в памяти держатся списки только одной
+    пачки. С флагом --check только сообщает о расхождениях.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить списки покупок на расхождения',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество пользователей в одной пачке',
+        )
+
+    def handle(self, *args, **options):
+        total = last_id = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not user_ids:
+                break
+            if options['check']:
+                total += self.check_batch(user_ids)
+            else:
+                total += self.rebuild_batch(user_ids)
+            last_id = user_ids[-1]
+        if not options['check']:
+            self.stdout.write(f'Списки покупок пересчитаны, позиций: {total}')
+        elif total:
+            self.stdout.write(f'Найдено расхождений: {total}')
+        else:
+            self.stdout.write('Расхождений не найдено')
+
+    def check_batch(self, user_ids):
+        """Выводит расхождения в списках покупок и возвращает их число."""
+        expected = ShoppingListItem.objects.calculate(user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingListItem.objects.filter(user_id__in=user_ids)
+            .values_list('user_id', 'ingredient_id', 'amount').order_by()
+        }
+        drift = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        for user_id, ingredient_id in sorted(drift):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидается {expected.get((user_id, ingredient_id), 0)}, '
+                f'сохранено {stored.get((user_id, ingredient_id), 0)}'
+            )
+        return len(drift)
+
+    def rebuild_batch(self, user_ids):
+        """Пересчитывает списки покупок и возвращает число позиций."""
+        with transaction.atomic():
+            expected = ShoppingListItem.objects.calculate(user_ids)
+            ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(user_id=user_id,
+                                     ingredient_id=ingredient_id,
+                                     amount=amount)
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000,
+            )
+        return len(expected)
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+
+def count_subquery(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на объект."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count')
+    ), Value(0))
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает денормализованные счетчики: количество добавлений
+    рецептов в избранное, количество рецептов и подписчиков авторов.
+    """
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, counter, related_model, field in COUNTERS:
+                actual = count_subquery(related_model, field)
+                drift = model.objects.annotate(actual=actual).exclude(
+                    **{counter: F('actual')}).count()
+                model.objects.update(**{counter: actual})
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}.{counter}: '
+                    f'исправлено {drift}'
+                )
+        self.stdout.write('Счетчики успешно пересчитаны')
@@ -0,0 +1,78 @@
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from api.cache import RECIPES_LIST_VERSION, bump_version
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+BATCH_SIZE = 1000
+# Добавления старше этого количества периодов полураспада не учитываются
+# в trending: их вес меньше 0.001
+TRENDING_HORIZON = 10
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает показатели для сортировок popular и trending.
+    popular - количество добавлений рецепта в избранное и список покупок,
+    trending - то же с весом, убывающим вдвое за TRENDING_HALF_LIFE часов.
+    Рецепты обрабатываются пачками по возрастанию id.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов в одной пачке',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        now = timezone.now()
+        half_life = settings.TRENDING_HALF_LIFE * 3600
+        since = now - timedelta(seconds=half_life * TRENDING_HORIZON)
+        processed = last_id = 0
+        while True:
+            recipe_ids = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not recipe_ids:
+                break
+            popularity = Counter()
+            trending = defaultdict(float)
+            for model in (Favorite, ShoppingCart):
+                events = model.objects.filter(
+                    recipe_id__in=recipe_ids).order_by()
+                popularity.update(dict(
+                    events.values('recipe_id').annotate(count=Count('pk'))
+                    .values_list('recipe_id', 'count')
+                ))
+                for recipe_id, date_added in events.filter(
+                        date_added__gte=since).values_list(
+                        'recipe_id', 'date_added'):
+                    age = max((now - date_added).total_seconds(), 0)
+                    trending[recipe_id] += 0.5 ** (age / half_life)
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(pk=pk, popularity=popularity[pk],
+                           trending=trending[pk])
+                    for pk in recipe_ids
+                ],
+                ('popularity', 'trending'),
+            )
+            processed += len(recipe_ids)
+            last_id = recipe_ids[-1]
+        bump_version(RECIPES_LIST_VERSION)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Показатели пересчитаны для {processed} рецептов '
+            f'за {elapsed:.2f} с ({processed / (elapsed or 1e-9):.0f} '
+            'рецептов/с)'
+        )
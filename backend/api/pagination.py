@@ -1,5 +1,21 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from .cache import RECIPES_LIST_VERSION, USER_FLAGS_VERSION, get_versions
 from .params import PAGE_SIZE
 
 
@@ -7,3 +23,127 @@ class PageLimitPagination(PageNumberPagination):
     """Стандартный пагинатор с выводом запрошенного количества страниц."""
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Пагинатор, который считает общее количество объектов без аннотаций
+    и кеширует результат на RECIPE_COUNT_CACHE_TIMEOUT секунд.
+    В ключ входят версии `version_keys`, поэтому после изменения данных
+    количество считается заново.
+    """
+
+    def __init__(self, *args, version_keys=(RECIPES_LIST_VERSION,),
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version_keys = version_keys
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by().values('pk')
+        versions = get_versions(self.version_keys)
+        key = 'count:{}:{}'.format(
+            ':'.join(versions[key] for key in self.version_keys),
+            md5(str(queryset.query).encode()).hexdigest(),
+        )
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.RECIPE_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class RecipePagination(PageLimitPagination):
+    """
+    Пагинатор рецептов. По умолчанию работает постранично, как
+    PageLimitPagination, но с кешированием общего количества рецептов.
+    При наличии параметра `cursor` (в том числе пустого) переключается на
+    курсорную пагинацию по паре (поле сортировки, id): следующая страница
+    выбирается условием по индексу, без OFFSET и без подсчета количества.
+    Поддерживается сортировка вида ('-поле', '-id'), где поле - поле модели
+    или аннотация, по умолчанию (pub_date, id).
+    """
+    django_paginator_class = CachedCountPaginator
+    cursor_query_param = 'cursor'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+    use_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            # Фильтры is_favorited и is_in_shopping_cart зависят от отметок
+            # пользователя, которые сбрасывают только его версию
+            version_keys = (RECIPES_LIST_VERSION,)
+            if request.user.is_authenticated:
+                version_keys += (
+                    USER_FLAGS_VERSION.format(pk=request.user.pk),)
+            self.django_paginator_class = partial(
+                CachedCountPaginator, version_keys=version_keys)
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = queryset.query.order_by or self.ordering
+        self.field = ordering[0].lstrip('-')
+        queryset = queryset.order_by(f'-{self.field}', '-id')
+        position = self.decode_cursor(request, queryset)
+        if position:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__lt': value})
+                | Q(**{self.field: value, 'pk__lt': pk})
+            )
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(getattr(last, self.field), last.pk),
+        )
+
+    @staticmethod
+    def encode_cursor(value, pk):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        position = f'{value} {pk}'.encode()
+        return urlsafe_b64encode(position).decode('ascii')
+
+    def get_cursor_field(self, queryset):
+        """Поле сортировки: аннотация запроса или поле модели."""
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def decode_cursor(self, request, queryset):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = urlsafe_b64decode(cursor.encode('ascii')).decode()
+            value, pk = position.split(' ')
+            value = self.get_cursor_field(queryset).to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
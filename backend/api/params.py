@@ -8,3 +8,44 @@ MIN_AMOUNT_INGREDIENTS = 1
 MAX_AMOUNT_INGREDIENTS = 32000
 # Максимальное количество ингредиентов для рецепта
 PAGE_SIZE = 10
+# Количество строк списка покупок, читаемых из курсора за один раз
+SHOPPING_LIST_CHUNK_SIZE = 500
+# Сортировки списка рецептов по параметру ordering
+RECIPE_ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending', '-id'),
+    'favorited': ('-favorited_at', '-id'),
+}
+RECIPE_ORDERING_CHOICES = (
+    ('popular', 'Популярные'),
+    ('trending', 'Набирающие популярность'),
+    ('favorited', 'Недавно добавленные в избранное'),
+)
+# Максимальное количество id в одном пакете add/remove пакетных эндпоинтов
+BATCH_MAX_SIZE = 100
+# Режимы фильтрации рецептов по нескольким тегам
+TAGS_MODE_CHOICES = (
+    ('any', 'Любой из тегов'),
+    ('all', 'Все теги'),
+)
+# Допустимое количество SQL-запросов для представлений (QueryBudgetMiddleware).
+# Значения - измеренные при холодном кеше (в том числе кеше токенов)
+# в api/tests/test_query_budgets.py
+# (с точками сохранения транзакций тестов), тест проверяет их соблюдение
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 11,
+    'RecipeViewSet.retrieve': 9,
+    'RecipeViewSet.create': 15,
+    'RecipeViewSet.partial_update': 24,
+    'RecipeViewSet.favorite_batch': 11,
+    'RecipeViewSet.shopping_cart_batch': 22,
+    'UsersViewSet.list': 5,
+    'UsersViewSet.retrieve': 4,
+    'UsersViewSet.me': 3,
+    'UsersViewSet.subscriptions': 6,
+    'UsersViewSet.subscribe_batch': 11,
+    'TagsViewSet.list': 3,
+    'TagsViewSet.retrieve': 3,
+    'IngredientsViewSet.list': 4,
+    'IngredientsViewSet.retrieve': 3,
+}
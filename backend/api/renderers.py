@@ -0,0 +1,269 @@
+import csv
+import json
+import re
+from abc import ABC, abstractmethod
+from itertools import chain, islice
+from uuid import uuid4
+
+from django.conf import settings
+from rest_framework.compat import (INDENT_SEPARATORS, LONG_SEPARATORS,
+                                   SHORT_SEPARATORS)
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SHOPPING_LIST_TITLE = 'Список покупок:'
+# Заглушка на месте готового фрагмента JSON: непечатный символ
+# кодируется как \u0000 и не встречается в обычных данных
+FRAGMENT_PLACEHOLDER = '\x00{token}:{index}\x00'
+FRAGMENT_PATTERN = rb'"\\u0000%s:(\d+)\\u0000"'
+
+
+class JSONFragment(bytes):
+    """
+    Готовый JSON (например, закешированное представление), который
+    FastJSONRenderer вставляет в ответ как есть, без декодирования и
+    повторного кодирования.
+    """
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, который кодирует ответы через orjson, если он установлен
+    и выбран настройкой JSON_ENCODER, иначе - стандартным модулем json.
+    Ответ с отступами (например, для Browsable API) всегда кодируется
+    модулем json.
+    Значения JSONFragment в данных вставляются в ответ как есть: при
+    кодировании на их месте оставляется строка-заглушка, которая затем
+    заменяется байтами фрагмента.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, JSONFragment):
+            return bytes(data)
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        encoder = self.encoder_class()
+        fragments = []
+        token = uuid4().hex
+
+        def default(obj):
+            if isinstance(obj, JSONFragment):
+                fragments.append(obj)
+                return FRAGMENT_PLACEHOLDER.format(
+                    token=token, index=len(fragments) - 1)
+            return encoder.default(obj)
+
+        if (orjson is not None and settings.JSON_ENCODER == 'orjson'
+                and indent is None and self.compact
+                and not self.ensure_ascii):
+            ret = orjson.dumps(data, default=default, option=(
+                orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME))
+            ret = ret.replace(
+                '\u2028'.encode(), b'\\u2028').replace(
+                '\u2029'.encode(), b'\\u2029')
+        else:
+            if indent is not None:
+                separators = INDENT_SEPARATORS
+            elif self.compact:
+                separators = SHORT_SEPARATORS
+            else:
+                separators = LONG_SEPARATORS
+            ret = json.dumps(
+                data, cls=self.encoder_class, default=default, indent=indent,
+                ensure_ascii=self.ensure_ascii, allow_nan=not self.strict,
+                separators=separators,
+            ).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+            ret = ret.encode()
+        if not fragments:
+            return ret
+        return re.sub(FRAGMENT_PATTERN % token.encode(),
+                      lambda match: fragments[int(match[1])], ret)
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    Выбирает формат списка покупок по параметру `format`, а без него
+    отдает первый из доступных рендереров независимо от заголовка Accept.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        if format_suffix or request.query_params.get(
+                self.settings.URL_FORMAT_OVERRIDE):
+            return super().select_renderer(request, renderers, format_suffix)
+        return renderers[0], renderers[0].media_type
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    """
+    Базовый рендерер списка покупок. Метод stream принимает итератор строк
+    (название, количество, единица измерения) и отдает файл по частям,
+    не собирая его в памяти целиком. Ошибки рендерятся в JSON
+    (RecipeViewSet.finalize_response).
+    """
+    charset = 'utf-8'
+
+    @property
+    def filename(self):
+        return f'shopping_cart.{self.format}'
+
+    @staticmethod
+    def format_row(row):
+        name, amount, measurement_unit = row
+        return f'{name} - {amount} {measurement_unit}'
+
+    @abstractmethod
+    def stream(self, rows, title=SHOPPING_LIST_TITLE):
+        """Отдает файл по частям (bytes)."""
+
+
+class PlainTextRenderer(ShoppingListRenderer):
+    """Список покупок в виде текстового файла."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows, title=SHOPPING_LIST_TITLE):
+        yield f'{title}\n\n'.encode(self.charset)
+        for row in rows:
+            yield f'{self.format_row(row)}\n'.encode(self.charset)
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Количество', 'Единица измерения')
+
+    def stream(self, rows, title=SHOPPING_LIST_TITLE):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for row in rows:
+            yield writer.writerow(row).encode(self.charset)
+
+
+class PDFRenderer(ShoppingListRenderer):
+    """
+    Список покупок в формате PDF. Документ пишется постранично: каждая
+    страница отдается клиенту сразу после заполнения, а таблица смещений
+    объектов выводится в конце. Используется стандартный шрифт Helvetica
+    с кодировкой cp1251, поэтому шрифт не встраивается в документ.
+    """
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    encoding = 'cp1251'
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 11
+    leading = 16
+
+    @property
+    def lines_per_page(self):
+        return (self.page_height - 2 * self.margin) // self.leading
+
+    @staticmethod
+    def glyph_name(char):
+        """
+        Название глифа по Adobe Glyph List: для кириллицы используются
+        имена afii, которые понимает большинство программ просмотра.
+        """
+        punctuation = {
+            '«': 'guillemotleft', '»': 'guillemotright', '–': 'endash',
+            '—': 'emdash', '…': 'ellipsis', '№': 'afii61352',
+        }
+        if char in punctuation:
+            return punctuation[char]
+        alphabet = 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+        if char in alphabet:
+            return f'afii{10017 + alphabet.index(char)}'
+        if char in alphabet.lower():
+            return f'afii{10065 + alphabet.lower().index(char)}'
+        return f'uni{ord(char):04X}'
+
+    def font_differences(self):
+        """Сопоставляет байты cp1251 с названиями глифов."""
+        names = []
+        for code in range(128, 256):
+            try:
+                char = bytes((code,)).decode(self.encoding)
+            except UnicodeDecodeError:
+                continue
+            names.append(f'{code} /{self.glyph_name(char)}')
+        return ' '.join(names).encode('ascii')
+
+    def escape(self, text):
+        text = text.encode(self.encoding, errors='replace')
+        return (text.replace(b'\\', b'\\\\')
+                .replace(b'(', b'\\(').replace(b')', b'\\)'))
+
+    def page_content(self, lines):
+        top = self.page_height - self.margin
+        content = [
+            b'BT /F1 %d Tf %d TL %d %d Td' % (
+                self.font_size, self.leading, self.margin, top)
+        ]
+        content.extend(b'(%s) Tj T*' % self.escape(line) for line in lines)
+        content.append(b'ET')
+        return b'\n'.join(content)
+
+    def stream(self, rows, title=SHOPPING_LIST_TITLE):
+        offsets = {}
+        position = 0
+
+        def write_object(number, body):
+            nonlocal position
+            offsets[number] = position
+            chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+            position += len(chunk)
+            return chunk
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position += len(header)
+        yield header
+        yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        yield write_object(3, (
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            b'/Differences [%s] >> >>' % self.font_differences()
+        ))
+        lines = chain((title, ''), map(self.format_row, rows))
+        pages = []
+        number = 3
+        while True:
+            page_lines = list(islice(lines, self.lines_per_page))
+            if not page_lines and pages:
+                break
+            content = self.page_content(page_lines)
+            yield write_object(number + 1, b'<< /Length %d >>\nstream\n%s\n'
+                                           b'endstream' % (len(content),
+                                                           content))
+            yield write_object(number + 2, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                b'/Resources << /Font << /F1 3 0 R >> >> '
+                b'/Contents %d 0 R >>' % (
+                    self.page_width, self.page_height, number + 1)
+            ))
+            pages.append(number + 2)
+            number += 2
+        yield write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % page for page in pages), len(pages)))
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (number + 1)]
+        xref.extend(
+            b'%010d 00000 n \n' % offsets[key] for key in sorted(offsets)
+        )
+        yield b''.join(xref)
+        yield (b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (number + 1, position))
@@ -0,0 +1,90 @@
+from django.db.models import F
+
+from recipes.images import choose_image_variant, parse_image_variants
+from recipes.models import IngredientAmount, Recipe
+from .serializers import get_subscriptions
+
+RECIPE_FIELDS = ('id', 'name', 'image', 'image_variants', 'text',
+                 'cooking_time', 'author_id')
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def get_image_url(name, variants, context):
+    """Повторяет RecipeImageField.to_representation для значений полей."""
+    if not name:
+        return None
+    width = context.get('image_width')
+    if width:
+        name = choose_image_variant(
+            parse_image_variants(name, variants), width) or name
+    url = Recipe._meta.get_field('image').storage.url(name)
+    request = context.get('request')
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def represent_recipes(recipe_ids, context, user_id=None):
+    """
+    Представления рецептов `recipe_ids` в формате RecipeSerializer,
+    собранные напрямую из values() без экземпляров моделей и полей
+    сериализаторов. Выполняет три запроса: рецепты с авторами, теги и
+    ингредиенты (и один запрос подписок, если их нет в контексте).
+    Признаки is_favorited и is_in_shopping_cart считаются для `user_id`,
+    без него - False. Рецепты возвращаются в порядке `recipe_ids`,
+    отсутствующие пропускаются.
+    Совпадение с RecipeSerializer проверяет api.tests.test_representations.
+    """
+    recipes = Recipe.objects.filter(pk__in=recipe_ids).order_by()
+    flags = ()
+    if user_id is not None:
+        recipes = recipes.add_annotations(user_id)
+        flags = ('is_favorited', 'is_in_shopping_cart')
+    rows = {
+        row['id']: row for row in recipes.values(
+            *RECIPE_FIELDS, *flags,
+            **{f'author_{field}': F(f'author__{field}')
+               for field in AUTHOR_FIELDS},
+        )
+    }
+    tags = {pk: [] for pk in rows}
+    for recipe_id, *tag in Recipe.tags.through.objects.filter(
+            recipe_id__in=rows).values_list(
+                'recipe_id', 'tag__id', 'tag__name', 'tag__color',
+                'tag__slug').order_by('tag__name'):
+        tags[recipe_id].append(dict(zip(('id', 'name', 'color', 'slug'),
+                                        tag)))
+    ingredients = {pk: [] for pk in rows}
+    for recipe_id, *ingredient in IngredientAmount.objects.filter(
+            recipe_id__in=rows).values_list(
+                'recipe_id', 'ingredient__id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount').order_by('-id'):
+        ingredients[recipe_id].append(dict(zip(
+            ('id', 'name', 'measurement_unit', 'amount'), ingredient)))
+    subscriptions = get_subscriptions(context)
+    data = []
+    for pk in recipe_ids:
+        row = rows.get(pk)
+        if row is None:
+            continue
+        data.append({
+            'id': pk,
+            'tags': tags[pk],
+            'author': {
+                'email': row['author_email'],
+                'id': row['author_id'],
+                'username': row['author_username'],
+                'first_name': row['author_first_name'],
+                'last_name': row['author_last_name'],
+                'is_subscribed': row['author_id'] in subscriptions,
+            },
+            'ingredients': ingredients[pk],
+            'is_favorited': row.get('is_favorited', False),
+            'is_in_shopping_cart': row.get('is_in_shopping_cart', False),
+            'name': row['name'],
+            'image': get_image_url(row['image'], row['image_variants'],
+                                   context),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        })
+    return data
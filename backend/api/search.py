@@ -0,0 +1,75 @@
+from django.conf import settings
+
+from recipes.models import Ingredient
+from .cache import INGREDIENTS_VERSION, ProcessSnapshot
+
+
+class _TrieNode:
+    __slots__ = ('children', 'items')
+
+    def __init__(self):
+        self.children = {}
+        self.items = []
+
+
+class IngredientTrie:
+    """
+    Префиксное дерево по названиям ингредиентов. Каждый узел хранит
+    отсортированный список ингредиентов своего поддерева, поэтому поиск
+    по префиксу не обходит дерево и не обращается к базе данных.
+    """
+
+    def __init__(self, ingredients):
+        self.root = _TrieNode()
+        self.items = sorted(ingredients, key=lambda item: item.name.lower())
+        self.names = [ingredient.name.lower() for ingredient in self.items]
+        for name, ingredient in zip(self.names, self.items):
+            node = self.root
+            node.items.append(ingredient)
+            for char in name:
+                node = node.children.setdefault(char, _TrieNode())
+                node.items.append(ingredient)
+
+    def startswith(self, prefix):
+        """Ингредиенты, название которых начинается с prefix."""
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.items
+
+    def search(self, term):
+        """
+        Ингредиенты, в названии которых встречается term: сначала
+        совпадения по префиксу, затем по подстроке.
+        """
+        term = term.lower()
+        return self.startswith(term) + [
+            ingredient
+            for name, ingredient in zip(self.names, self.items)
+            if term in name and not name.startswith(term)
+        ]
+
+
+ingredient_trie = ProcessSnapshot(
+    INGREDIENTS_VERSION,
+    lambda: IngredientTrie(
+        Ingredient.objects.only('id', 'name', 'measurement_unit')),
+    timeout=settings.INGREDIENT_TRIE_TIMEOUT,
+)
+
+
+def get_ingredient_trie():
+    """
+    Возвращает префиксное дерево ингредиентов текущего процесса.
+    Дерево строится при первом обращении и перестраивается после изменения
+    ингредиентов в любом процессе (по версии в общем кеше) или по
+    истечении INGREDIENT_TRIE_TIMEOUT секунд.
+    """
+    return ingredient_trie.get()
+
+
+def invalidate_ingredient_trie():
+    """Сбрасывает префиксное дерево ингредиентов текущего процесса."""
+    ingredient_trie.reset()
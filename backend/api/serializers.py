@@ -1,20 +1,126 @@
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.fields.files import FieldFile
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from rest_framework.validators import UniqueTogetherValidator
 
 from recipes.models import (Ingredient, IngredientAmount, Recipe, Tag,
-                            Favorite, ShoppingCart)
+                            Favorite, ShoppingCart, ShoppingListItem)
+from recipes.images import get_image_variant
 from users.models import User
-from api.params import (MIN_COOKING_TIME,
+from api.params import (BATCH_MAX_SIZE,
+                        MIN_COOKING_TIME,
                         MAX_COOKING_TIME,
                         MIN_AMOUNT_INGREDIENTS,
                         MAX_AMOUNT_INGREDIENTS)
 
 
+def get_subscriptions(context):
+    """
+    Возвращает множество id авторов, на которых подписан текущий
+    пользователь. Множество загружается одним запросом и сохраняется в
+    контексте сериализатора, поэтому все вложенные сериализаторы
+    используют общий результат.
+    """
+    subscriptions = context.get('subscriptions')
+    if subscriptions is None:
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        if user is None or user.is_anonymous:
+            subscriptions = set()
+        else:
+            subscriptions = set(
+                user.follower.values_list('author_id', flat=True)
+            )
+        context['subscriptions'] = subscriptions
+    return subscriptions
+
+
+def get_objects_by_pks(queryset, pks, message):
+    """
+    Загружает объекты с первичными ключами `pks` одним запросом IN и
+    возвращает их в порядке `pks`. Если часть объектов не найдена,
+    выбрасывает одну ошибку со всеми отсутствующими ключами.
+    """
+    objects = queryset.in_bulk(set(pks))
+    missing = sorted({pk for pk in pks if pk not in objects})
+    if missing:
+        raise serializers.ValidationError(
+            message.format(pk_values=', '.join(map(str, missing)))
+        )
+    return [objects[pk] for pk in pks]
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, которые проверяются одним запросом."""
+    default_error_messages = {
+        'does_not_exist': 'Объекты с id {pk_values} не существуют.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        pks = []
+        for pk in data:
+            # Как и в PrimaryKeyRelatedField, id - целое число или строка
+            # из цифр; bool, дробные числа и строки вида ' 1' не принимаются
+            if isinstance(pk, str) and pk.isascii() and pk.isdigit():
+                pk = int(pk)
+            if not isinstance(pk, int) or isinstance(pk, bool):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(pk).__name__)
+            pks.append(pk)
+        return get_objects_by_pks(
+            self.child_relation.get_queryset(), pks,
+            self.error_messages['does_not_exist'],
+        )
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при many=True загружает все объекты
+    одним запросом вместо отдельного запроса на каждый id.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Фото рецепта. При чтении отдает наименьшую уменьшенную копию шириной
+    не меньше `width` (или `image_width` из контекста сериализатора), если
+    копии уже построены, иначе - исходное фото.
+    """
+
+    def __init__(self, *args, width=None, **kwargs):
+        self.width = width
+        super().__init__(*args, **kwargs)
+
+    def get_attribute(self, instance):
+        image = super().get_attribute(instance)
+        width = self.width or self.context.get('image_width')
+        if image and width:
+            name = get_image_variant(instance, width)
+            if name:
+                return FieldFile(instance, image.field, name)
+        return image
+
+
 class UserCreateSerializer(UserCreateSerializer):
     """Сериализатор для создания нового пользователя."""
 
@@ -64,10 +170,7 @@ class UserReadSerializer(UserSerializer):
 
     def get_is_subscribed(self, author):
         """Проверяет, подписан ли текущий пользователь на автора."""
-        request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            return request.user.follower.filter(author=author).exists()
-        return False
+        return author.pk in get_subscriptions(self.context)
 
 
 class SetPasswordSerializer(serializers.Serializer):
@@ -122,12 +225,27 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = '__all__',
 
 
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """
+    Список ингредиентов рецепта. Все ингредиенты загружаются одним
+    запросом, несуществующие id перечисляются в одной ошибке.
+    """
+
+    def to_internal_value(self, data):
+        ingredients = super().to_internal_value(data)
+        objects = get_objects_by_pks(
+            Ingredient.objects.all(),
+            [ingredient['ingredient']['id'] for ingredient in ingredients],
+            'Ингредиенты с id {pk_values} не существуют.',
+        )
+        for ingredient, obj in zip(ingredients, objects):
+            ingredient['ingredient']['id'] = obj
+        return ingredients
+
+
 class IngredientAmountSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с количеством ингредиентов в рецепте."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient.id'
-    )
+    id = serializers.IntegerField(source='ingredient.id')
     name = serializers.CharField(
         source='ingredient.name',
         read_only=True
@@ -149,6 +267,7 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientAmount
         fields = ('id', 'name', 'measurement_unit', 'amount')
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -161,7 +280,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
-    image = Base64ImageField(required=False, allow_null=True)
+    image = RecipeImageField(required=False, allow_null=True)
 
     class Meta:
         model = Recipe
@@ -173,6 +292,10 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 class RecipeShortSerializer(RecipeSerializer):
     """Сериализатор для работы с рецептами с укороченным набором полей."""
+    image = RecipeImageField(
+        read_only=True,
+        width=settings.RECIPE_IMAGE_WIDTHS[0],
+    )
 
     class Meta:
         model = Recipe
@@ -188,8 +311,7 @@ class FollowUserSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = RecipeShortSerializer(many=True, read_only=True)
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -213,9 +335,7 @@ class FollowUserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, author):
         """Проверяет, подписан ли текущий пользователь на автора."""
-        user = self.context.get('request').user
-        return (user.is_authenticated
-                and user.follower.filter(author=author).exists())
+        return author.pk in get_subscriptions(self.context)
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -223,9 +343,8 @@ class FollowSerializer(serializers.ModelSerializer):
     Сериализатор для вывода списка авторов, на которых подписан пользователь.
     """
     is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes = RecipeShortSerializer(many=True, read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -236,23 +355,12 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, author):
         """Проверяет, подписан ли текущий пользователь на автора."""
-        user = self.context.get('request').user
-        return (user.is_authenticated
-                and user.follower.filter(author=author).exists())
-
-    def get_recipes(self, obj):
-        """
-        Выводит список рецептов авторов, на которых подписан текущий
-        пользователь.
-        """
-        recipes = obj.recipes.all()
-        serializer = RecipeSerializer(recipes, many=True, read_only=True)
-        return serializer.data
+        return author.pk in get_subscriptions(self.context)
 
 
 class RecipeCreateSerializer(RecipeSerializer):
     """Сериализатор для создания/обновления/удаления рецептов."""
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -303,6 +411,7 @@ class RecipeCreateSerializer(RecipeSerializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients_amount')
@@ -312,6 +421,7 @@ class RecipeCreateSerializer(RecipeSerializer):
         self.save_ingredients(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
@@ -322,14 +432,70 @@ class RecipeCreateSerializer(RecipeSerializer):
         )
         ingredients = validated_data.pop('ingredients_amount')
         tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.ingredients.clear()
-        instance.tags.add(*tags)
-        self.save_ingredients(instance, ingredients)
+        instance.tags.set(tags)
+        changes = self.update_ingredients(instance, ingredients)
         instance.save()
+        self.update_shopping_lists(instance, changes)
         return instance
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """
+        Приводит ингредиенты рецепта к списку `ingredients`, изменяя только
+        отличающиеся строки: новые добавляются, лишние удаляются, у
+        оставшихся обновляется количество.
+        Возвращает словарь {id ингредиента: изменение количества}.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientAmount.objects.filter(
+                recipe_id=recipe.pk).only('id', 'recipe_id', 'ingredient_id',
+                                          'amount')
+        }
+        amounts = {
+            ingredient['ingredient']['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changes = {}
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id, 0)
+            if amount != item.amount:
+                changes[ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        removed = [item.pk for item in changed if not item.amount]
+        if removed:
+            IngredientAmount.objects.filter(pk__in=removed).delete()
+        IngredientAmount.objects.bulk_update(
+            [item for item in changed if item.amount], ('amount',))
+        added = {
+            ingredient_id: amount for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        }
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in added.items()
+        )
+        changes.update(added)
+        return changes
+
+    @staticmethod
+    def update_shopping_lists(recipe, changes):
+        """
+        Переносит изменения количеств ингредиентов рецепта в списки покупок
+        пользователей, у которых рецепт лежит в корзине.
+        """
+        if changes:
+            ShoppingListItem.objects.apply_amounts(
+                recipe.shopping_cart.values_list('user_id', flat=True),
+                changes,
+            )
+
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,), 'ingredients_amount__ingredient', 'tags')
         return RecipeSerializer(instance, context=self.context).data
 
 
@@ -377,3 +543,33 @@ class ShoppingCartSerializer(RecipeShortSerializer):
                 message='Рецепт уже был добавлен в список покупок'
             )
         ]
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    Сериализатор пакета id для пакетных эндпоинтов: `add` - добавить,
+    `remove` - удалить.
+    """
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=BATCH_MAX_SIZE,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=BATCH_MAX_SIZE,
+    )
+
+    def validate(self, data):
+        add, remove = data['add'], data['remove']
+        if not add and not remove:
+            raise serializers.ValidationError(
+                {'error': 'Передайте id в списках add или remove.'})
+        if len(set(add)) < len(add) or len(set(remove)) < len(remove):
+            raise serializers.ValidationError(
+                {'error': 'id в списке не должны повторяться.'})
+        if set(add) & set(remove):
+            raise serializers.ValidationError(
+                {'error': 'Один id нельзя одновременно добавить и удалить.'})
+        return data
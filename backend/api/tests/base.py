@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-media-')
+CACHE_LOCATION = tempfile.mkdtemp(prefix='foodgram-cache-')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    RECIPE_IMAGE_WORKERS=0,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_LOCATION,
+    }},
+)
+class FoodgramTestCase(TestCase):
+    """
+    Базовый класс тестов API: пользователи с подписками, теги,
+    ингредиенты и рецепты, часть из которых в избранном и в списке
+    покупок первого пользователя. Кеш - общий файловый во временном
+    каталоге, он очищается перед каждым тестом.
+    """
+    recipes_count = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com',
+                username=f'user{number}',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password='Password-12345',
+            )
+            for number in range(4)
+        ]
+        cls.user = cls.users[0]
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                      ('Обед', '#49B64E', 'lunch'),
+                                      ('Ужин', '#8775D2', 'dinner'))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(10)
+        ]
+        cls.recipes = [
+            cls.create_recipe(cls.users[number % len(cls.users)], number)
+            for number in range(cls.recipes_count)
+        ]
+        for author in cls.users[1:3]:
+            Follow.objects.create(user=cls.user, author=author)
+        for recipe in cls.recipes[:4]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[2:6]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def create_recipe(cls, author, number):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text=f'Описание рецепта {number}',
+            cooking_time=number + 1,
+        )
+        recipe.tags.set(cls.tags[:number % len(cls.tags) + 1])
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient,
+                             amount=index + 1)
+            for index, ingredient in enumerate(
+                cls.ingredients[number % 3:number % 3 + 4])
+        )
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
@@ -0,0 +1,55 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .base import FoodgramTestCase
+
+
+class CachedTokenAuthenticationTest(FoodgramTestCase):
+    """Кеш пользователей по токену."""
+
+    def count_token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        return sum('authtoken_token' in query['sql']
+                   for query in context.captured_queries)
+
+    def test_cached_after_first_request(self):
+        self.assertGreater(self.count_token_queries(), 0)
+        self.assertEqual(self.count_token_queries(), 0)
+
+    def test_other_user_change_keeps_cache(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[1].first_name = 'Другое имя'
+            self.users[1].save()
+        self.assertEqual(self.count_token_queries(), 0)
+
+    def test_own_change_resets_cache(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Новое имя'
+            self.user.save()
+        self.assertEqual(
+            self.client.get('/api/users/me/').json()['first_name'],
+            'Новое имя')
+
+    def test_last_login_keeps_cache(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=('last_login',))
+        self.assertEqual(self.count_token_queries(), 0)
+
+    def test_deactivated_user(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_logout(self):
+        self.count_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
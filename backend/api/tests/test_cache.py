@@ -0,0 +1,87 @@
+from django.test import override_settings
+
+from recipes.models import Recipe
+from .base import FoodgramTestCase
+
+LOCAL_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}}
+
+
+class RecipeResponseCacheTest(FoodgramTestCase):
+    """Кеш ответов со списком и карточкой рецепта."""
+    recipes_count = 15
+
+    def test_anonymous_list_is_cached(self):
+        first = self.anonymous.get('/api/recipes/')
+        second = self.anonymous.get('/api/recipes/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'example.com'])
+    def test_list_cache_key_includes_scheme_and_host(self):
+        self.anonymous.get('/api/recipes/?page=1')
+        response = self.anonymous.get('/api/recipes/?page=1', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['next'].startswith('https://'))
+        response = self.anonymous.get('/api/recipes/?page=1',
+                                      HTTP_HOST='example.com')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('example.com', response.json()['next'])
+
+    def test_unknown_params_bypass_cache(self):
+        self.anonymous.get('/api/recipes/?utm=1')
+        response = self.anonymous.get('/api/recipes/?utm=1')
+        self.assertNotIn('X-Cache', response)
+
+    def test_change_invalidates_list_and_detail(self):
+        recipe = self.recipes[12]
+        path = f'/api/recipes/{recipe.pk}/'
+        self.anonymous.get('/api/recipes/')
+        self.anonymous.get(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(path, {
+                'name': 'Новое название',
+                'text': 'Описание',
+                'cooking_time': 3,
+                'tags': [self.tags[0].pk],
+                'ingredients': [{'id': self.ingredients[0].pk,
+                                 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.anonymous.get(path)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], 'Новое название')
+        response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        names = {item['id']: item['name']
+                 for item in response.json()['results']}
+        self.assertEqual(names[recipe.pk], 'Новое название')
+
+    def test_authenticated_flags_overlay_cached_bodies(self):
+        self.anonymous.get('/api/recipes/')
+        data = {
+            item['id']: item
+            for item in self.client.get('/api/recipes/').json()['results']
+        }
+        recipe = self.recipes[-1]
+        self.assertFalse(data[recipe.pk]['is_favorited'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        data = {
+            item['id']: item
+            for item in self.client.get('/api/recipes/').json()['results']
+        }
+        self.assertTrue(data[recipe.pk]['is_favorited'])
+        anonymous = self.anonymous.get('/api/recipes/').json()['results']
+        self.assertFalse(any(item['is_favorited'] for item in anonymous))
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_local_cache_disables_response_cache(self):
+        self.anonymous.get('/api/recipes/')
+        response = self.anonymous.get('/api/recipes/')
+        self.assertNotIn('X-Cache', response)
+        Recipe.objects.filter(pk=self.recipes[-1].pk).update(name='Другое')
+        response = self.anonymous.get(f'/api/recipes/{self.recipes[-1].pk}/')
+        self.assertEqual(response.json()['name'], 'Другое')
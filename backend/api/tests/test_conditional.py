@@ -0,0 +1,60 @@
+from django.test import override_settings
+
+from .base import FoodgramTestCase
+from .test_cache import LOCAL_CACHES
+
+
+class ConditionalGetTest(FoodgramTestCase):
+    """ETag и Last-Modified для рецептов, тегов и ингредиентов."""
+
+    def assert_not_modified_until_change(self, path, change):
+        etag = self.anonymous.get(path)['ETag']
+        response = self.anonymous.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.anonymous.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_recipe(self):
+        recipe = self.recipes[0]
+
+        def change():
+            recipe.name = 'Новое название'
+            recipe.save()
+
+        self.assert_not_modified_until_change(
+            f'/api/recipes/{recipe.pk}/', change)
+
+    def test_tags(self):
+        def change():
+            self.tags[0].name = 'Полдник'
+            self.tags[0].save()
+
+        self.assert_not_modified_until_change('/api/tags/', change)
+
+    def test_ingredients(self):
+        def change():
+            self.ingredients[0].name = 'соль'
+            self.ingredients[0].save()
+
+        self.assert_not_modified_until_change('/api/ingredients/', change)
+
+    def test_last_modified(self):
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        last_modified = self.anonymous.get(path)['Last-Modified']
+        response = self.anonymous.get(
+            path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(CACHES=LOCAL_CACHES)
+    def test_local_cache_disables_etag(self):
+        for path in ('/api/tags/', f'/api/recipes/{self.recipes[0].pk}/'):
+            with self.subTest(path=path):
+                response = self.anonymous.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+                self.assertEqual(
+                    self.anonymous.get(
+                        path, HTTP_IF_NONE_MATCH='"0"').status_code, 200)
@@ -0,0 +1,46 @@
+from recipes.models import Recipe
+
+from .base import FoodgramTestCase
+
+
+class RecipeCountersTest(FoodgramTestCase):
+    """Счетчики популярности при добавлении и удалении отметок."""
+
+    def get_counters(self, recipe):
+        return Recipe.objects.values_list(
+            'favorites_count', 'popularity', 'trending').get(pk=recipe.pk)
+
+    def test_favorite_and_delete(self):
+        recipe = self.recipes[10]
+        before = self.get_counters(recipe)
+        path = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(self.client.post(path).status_code, 201)
+        self.assertEqual(self.get_counters(recipe),
+                         (before[0] + 1, before[1] + 1, before[2] + 1))
+        self.assertEqual(self.client.delete(path).status_code, 204)
+        self.assertEqual(self.get_counters(recipe), before)
+
+    def test_batch_add_and_remove(self):
+        recipe = self.recipes[10]
+        before = self.get_counters(recipe)
+        path = '/api/recipes/shopping_cart/batch/'
+        self.client.post(path, {'add': [recipe.pk]}, format='json')
+        self.assertEqual(self.get_counters(recipe),
+                         (before[0], before[1] + 1, before[2] + 1))
+        self.client.post(path, {'remove': [recipe.pk]}, format='json')
+        self.assertEqual(self.get_counters(recipe), before)
+
+    def test_decayed_trending_not_negative(self):
+        recipe = self.recipes[0]
+        for remove in (
+            lambda: self.client.delete(
+                f'/api/recipes/{recipe.pk}/favorite/'),
+            lambda: self.client.post(
+                '/api/recipes/favorite/batch/', {'remove': [recipe.pk]},
+                format='json'),
+        ):
+            with self.subTest(remove=remove):
+                self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+                Recipe.objects.filter(pk=recipe.pk).update(trending=0.25)
+                remove()
+                self.assertEqual(self.get_counters(recipe)[2], 0)
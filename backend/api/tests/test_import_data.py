@@ -0,0 +1,73 @@
+import io
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from api.management.commands import import_data
+from recipes.models import Ingredient
+
+RECORDS = [
+    {'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+    for number in range(50)
+]
+
+
+class ImportDataTest(TestCase):
+    """Команда import_data."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='UTF-8') as file:
+            file.write(content)
+        return path
+
+    def call(self, *args):
+        call_command('import_data', *args, stdout=io.StringIO())
+
+    def assert_imported(self, records=RECORDS):
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {(record['name'], record['measurement_unit'])
+             for record in records},
+        )
+
+    def test_csv(self):
+        self.call(self.write('data.csv', ''.join(
+            f'{record["name"]},{record["measurement_unit"]}\n'
+            for record in RECORDS)))
+        self.assert_imported()
+
+    def test_json_read_in_chunks(self):
+        path = self.write('data.json', json.dumps(RECORDS, indent=2))
+        with mock.patch.object(import_data, 'JSON_CHUNK_SIZE', 7):
+            self.call(path, '--batch-size', '8')
+        self.assert_imported()
+
+    def test_json_lines(self):
+        self.call(self.write('data.jsonl', '\n'.join(
+            json.dumps(record) for record in RECORDS) + '\n\n'))
+        self.assert_imported()
+
+    def test_invalid_json(self):
+        for content in ('{}', '[{"name": "соль"}', '[{}, ]', '[1]',
+                        '[{} {}]'):
+            with self.subTest(content=content):
+                with self.assertRaises(CommandError):
+                    self.call(self.write('data.json', content))
+
+    def test_stdin_left_open(self):
+        stdin = io.TextIOWrapper(io.BytesIO(
+            json.dumps(RECORDS[0]).encode()), encoding='UTF-8')
+        with mock.patch.object(sys, 'stdin', stdin):
+            self.call('-', '--format', 'jsonl')
+        self.assertFalse(stdin.buffer.closed)
+        self.assert_imported(RECORDS[:1])
@@ -0,0 +1,44 @@
+from recipes.models import Favorite
+
+from .base import FoodgramTestCase
+
+
+class RecipePaginationTest(FoodgramTestCase):
+    """Постраничная и курсорная пагинация рецептов."""
+    recipes_count = 15
+
+    def test_count_after_new_recipe(self):
+        self.assertEqual(
+            self.anonymous.get('/api/recipes/').json()['count'], 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(self.user, 100)
+        self.assertEqual(
+            self.anonymous.get('/api/recipes/').json()['count'], 16)
+
+    def test_favorited_count_after_favorite(self):
+        path = '/api/recipes/?is_favorited=1'
+        self.assertEqual(self.client.get(path).json()['count'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipes[10])
+        self.assertEqual(self.client.get(path).json()['count'], 5)
+
+    def test_cursor_walks_all_recipes(self):
+        expected = [
+            item['id'] for item in
+            self.anonymous.get('/api/recipes/?limit=100').json()['results']
+        ]
+        ids = []
+        url = '/api/recipes/?limit=4&cursor='
+        while url:
+            data = self.anonymous.get(url).json()
+            self.assertNotIn('count', data)
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        for cursor in ('!', 'bm90IGEgY3Vyc29y'):
+            with self.subTest(cursor=cursor):
+                response = self.anonymous.get(
+                    f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
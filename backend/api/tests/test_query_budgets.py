@@ -0,0 +1,118 @@
+import base64
+from io import BytesIO
+
+from django.core.cache import cache
+from PIL import Image
+
+from api.authentication import token_cache
+from api.instrumentation import assert_query_budget
+from .base import FoodgramTestCase
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), (200, 10, 10)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class QueryBudgetTest(FoodgramTestCase):
+    """
+    Представления укладываются в бюджеты запросов QUERY_BUDGETS при
+    холодном кеше. Рецептов и ингредиентов больше размера страницы и
+    пакета, чтобы повторяющиеся запросы (N+1) превысили бюджет.
+    """
+    recipes_count = 15
+
+    def assert_budget(self, view_name, client, method, path, data=None,
+                      status=200):
+        cache.clear()
+        token_cache.items.clear()
+        with assert_query_budget(view_name):
+            response = getattr(client, method)(path, data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def recipe_data(self, **kwargs):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_data(),
+            'tags': [tag.pk for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 5}
+                for ingredient in self.ingredients
+            ],
+            **kwargs,
+        }
+
+    def test_recipes_list(self):
+        for client in (self.anonymous, self.client):
+            for path in ('/api/recipes/', '/api/recipes/?cursor=',
+                         '/api/recipes/?is_favorited=1&tags=breakfast',
+                         '/api/recipes/?ordering=popular',
+                         '/api/recipes/?is_in_shopping_cart=1&page=1'):
+                with self.subTest(path=path, client=client):
+                    self.assert_budget('RecipeViewSet.list', client, 'get',
+                                       path)
+
+    def test_recipes_retrieve(self):
+        path = f'/api/recipes/{self.recipes[0].pk}/'
+        for client in (self.anonymous, self.client):
+            with self.subTest(client=client):
+                self.assert_budget('RecipeViewSet.retrieve', client, 'get',
+                                   path)
+
+    def test_recipes_create(self):
+        self.assert_budget('RecipeViewSet.create', self.client, 'post',
+                           '/api/recipes/', self.recipe_data(), status=201)
+
+    def test_recipes_partial_update(self):
+        recipe = self.recipes[0]
+        self.assert_budget(
+            'RecipeViewSet.partial_update', self.client, 'patch',
+            f'/api/recipes/{recipe.pk}/',
+            self.recipe_data(tags=[self.tags[1].pk], ingredients=[
+                {'id': ingredient.pk, 'amount': 7}
+                for ingredient in self.ingredients[2:]
+            ]),
+        )
+
+    def test_batches(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        for view_name, path in (
+                ('RecipeViewSet.favorite_batch',
+                 '/api/recipes/favorite/batch/'),
+                ('RecipeViewSet.shopping_cart_batch',
+                 '/api/recipes/shopping_cart/batch/')):
+            with self.subTest(path=path):
+                self.assert_budget(view_name, self.client, 'post', path,
+                                   {'add': ids[6:], 'remove': ids[:3]})
+        self.assert_budget(
+            'UsersViewSet.subscribe_batch', self.client, 'post',
+            '/api/users/subscribe/batch/',
+            {'add': [user.pk for user in self.users[2:]],
+             'remove': [self.users[1].pk]},
+        )
+
+    def test_users(self):
+        for view_name, path in (
+                ('UsersViewSet.list', '/api/users/'),
+                ('UsersViewSet.retrieve', f'/api/users/{self.users[1].pk}/'),
+                ('UsersViewSet.me', '/api/users/me/'),
+                ('UsersViewSet.subscriptions',
+                 '/api/users/subscriptions/?recipes_limit=2')):
+            with self.subTest(path=path):
+                self.assert_budget(view_name, self.client, 'get', path)
+
+    def test_tags_and_ingredients(self):
+        for view_name, path in (
+                ('TagsViewSet.list', '/api/tags/'),
+                ('TagsViewSet.retrieve', f'/api/tags/{self.tags[0].pk}/'),
+                ('IngredientsViewSet.list', '/api/ingredients/?name=инг'),
+                ('IngredientsViewSet.retrieve',
+                 f'/api/ingredients/{self.ingredients[0].pk}/')):
+            for client in (self.anonymous, self.client):
+                with self.subTest(path=path, client=client):
+                    self.assert_budget(view_name, client, 'get', path)
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from api import batch
+from recipes.models import Favorite
+from users.models import Follow, User
+
+from .base import FoodgramTestCase
+
+
+class ConcurrentRelationTest(FoodgramTestCase):
+    """
+    Повторная проверка связи под блокировкой: параллельный запрос,
+    создавший связь до получения блокировки, дает ответ 400, а не 500.
+    """
+
+    def lock_after(self, create):
+        def lock(user):
+            create()
+            batch.lock_user_relations(user)
+        return mock.patch('api.views.lock_user_relations', side_effect=lock)
+
+    def test_subscribe(self):
+        author = self.users[3]
+        with self.lock_after(lambda: Follow.objects.create(
+                user=self.user, author=author)):
+            response = self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(),
+                         {'error': ['Вы уже подписаны на этого автора.']})
+
+    def test_favorite(self):
+        recipe = self.recipes[10]
+        with self.lock_after(lambda: Favorite.objects.create(
+                user=self.user, recipe=recipe)):
+            response = self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'non_field_errors': ['Рецепт уже был добавлен в избранное']})
+
+
+class SubscribeBatchTest(FoodgramTestCase):
+    """Пакетная подписка и отписка."""
+
+    def test_results_and_counters(self):
+        new, subscribed = self.users[3], self.users[1]
+        response = self.client.post('/api/users/subscribe/batch/', {
+            'add': [new.pk, self.user.pk, 10 ** 6, subscribed.pk],
+            'remove': [self.users[2].pk, new.pk + 10 ** 6],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['action'], item['status'])
+             for item in response.json()['results']],
+            [(new.pk, 'add', 'created'),
+             (self.user.pk, 'add', 'forbidden'),
+             (10 ** 6, 'add', 'not_found'),
+             (subscribed.pk, 'add', 'exists'),
+             (self.users[2].pk, 'remove', 'deleted'),
+             (new.pk + 10 ** 6, 'remove', 'not_found')],
+        )
+        self.assertEqual(
+            set(self.user.follower.values_list('author_id', flat=True)),
+            {new.pk, subscribed.pk})
+        self.assertEqual(
+            dict(User.objects.filter(pk__in=(new.pk, self.users[2].pk))
+                 .values_list('pk', 'followers_count')),
+            {new.pk: 1, self.users[2].pk: 0})
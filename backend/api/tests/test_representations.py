@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.base import ContentFile
+from django.test import RequestFactory
+
+from api.renderers import FastJSONRenderer
+from api.representations import represent_recipes
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe
+from .base import FoodgramTestCase
+
+
+class RepresentRecipesTest(FoodgramTestCase):
+    """
+    represent_recipes должен возвращать те же байты JSON, что и
+    RecipeSerializer. Тест нужно запускать после изменения любого из них.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipe = cls.recipes[0]
+        recipe.image.save('photo.png', ContentFile(b'photo'), save=True)
+        width = settings.RECIPE_LIST_IMAGE_WIDTH
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants={
+            'source': recipe.image.name,
+            'widths': {str(width): f'recipes/variants/{width}.webp'},
+        })
+
+    def assert_same_bytes(self, user, width):
+        request = RequestFactory().get('/', HTTP_HOST='testserver')
+        request.user = user
+        context = {'request': request, 'image_width': width}
+        recipe_ids = [recipe.pk for recipe in self.recipes]
+        expected = RecipeSerializer(
+            Recipe.objects.add_annotations(user.pk).filter(
+                pk__in=recipe_ids).order_by('pk'),
+            many=True,
+            context=dict(context),
+        ).data
+        actual = represent_recipes(sorted(recipe_ids), dict(context),
+                                   user.pk)
+        renderer = FastJSONRenderer()
+        self.assertEqual(len(actual), len(recipe_ids))
+        for expected_item, actual_item in zip(expected, actual):
+            with self.subTest(recipe=expected_item['id'], user=str(user),
+                              width=width):
+                self.assertEqual(renderer.render(actual_item),
+                                 renderer.render(expected_item))
+
+    def test_anonymous(self):
+        for width in (None, settings.RECIPE_LIST_IMAGE_WIDTH):
+            self.assert_same_bytes(AnonymousUser(), width)
+
+    def test_authenticated(self):
+        for width in (None, settings.RECIPE_LIST_IMAGE_WIDTH):
+            self.assert_same_bytes(self.user, width)
+
+    def test_flags_and_subscriptions(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        data = {
+            item['id']: item for item in represent_recipes(
+                [recipe.pk for recipe in self.recipes],
+                {'request': request}, self.user.pk)
+        }
+        self.assertTrue(data[self.recipes[0].pk]['is_favorited'])
+        self.assertFalse(data[self.recipes[0].pk]['is_in_shopping_cart'])
+        self.assertTrue(data[self.recipes[5].pk]['is_in_shopping_cart'])
+        self.assertTrue(data[self.recipes[1].pk]['author']['is_subscribed'])
+        self.assertFalse(data[self.recipes[0].pk]['author']['is_subscribed'])
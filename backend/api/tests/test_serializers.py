@@ -0,0 +1,31 @@
+from rest_framework.exceptions import ValidationError
+
+from api.serializers import RecipeCreateSerializer
+
+from .base import FoodgramTestCase
+
+
+class BulkPrimaryKeyRelatedFieldTest(FoodgramTestCase):
+    """Проверка id тегов рецепта одним запросом."""
+
+    def validate_tags(self, tags):
+        field = RecipeCreateSerializer().fields['tags']
+        return field.run_validation(tags)
+
+    def test_valid_ids(self):
+        tags = self.validate_tags([self.tags[0].pk, str(self.tags[1].pk)])
+        self.assertEqual(tags, self.tags[:2])
+
+    def test_incorrect_type(self):
+        for pk in (True, 1.5, float(self.tags[0].pk), ' 1', '1.0', '', None,
+                   [1], {'id': 1}):
+            with self.subTest(pk=pk):
+                with self.assertRaises(ValidationError) as context:
+                    self.validate_tags([pk])
+                self.assertEqual(
+                    context.exception.get_codes(), ['incorrect_type'])
+
+    def test_missing_ids(self):
+        with self.assertRaises(ValidationError) as context:
+            self.validate_tags([self.tags[0].pk, 10 ** 6])
+        self.assertIn(str(10 ** 6), str(context.exception.detail[0]))
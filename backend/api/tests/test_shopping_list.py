@@ -0,0 +1,89 @@
+import csv
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Sum
+
+from api.renderers import ShoppingListRenderer
+from recipes.models import IngredientAmount, ShoppingCart, ShoppingListItem
+
+from .base import FoodgramTestCase
+
+PATH = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingListDownloadTest(FoodgramTestCase):
+    """Загрузка списка покупок в разных форматах."""
+
+    def expected_rows(self):
+        rows = list(
+            IngredientAmount.objects.filter(
+                recipe__shopping_cart__user=self.user,
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit',
+            ).annotate(total=Sum('amount')).order_by('ingredient__name')
+        )
+        self.assertTrue(rows)
+        return rows
+
+    def download(self, file_format):
+        response = self.client.get(PATH, {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'shopping_cart.{file_format}',
+                      response['Content-Disposition'])
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        lines = self.download('txt').decode().splitlines()
+        self.assertEqual(lines[0], 'Список покупок:')
+        self.assertEqual(lines[2:], [
+            f'{name} - {amount} {unit}'
+            for name, unit, amount in self.expected_rows()
+        ])
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.download('csv').decode())))
+        self.assertEqual(rows[1:], [
+            [name, str(amount), unit]
+            for name, unit, amount in self.expected_rows()
+        ])
+
+    def test_pdf(self):
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    def test_errors_as_json(self):
+        response = self.anonymous.get(PATH, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_base_renderer_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingListRenderer()
+
+
+class RebuildShoppingListsTest(FoodgramTestCase):
+    """Команда rebuild_shopping_lists."""
+
+    def call(self, *args):
+        output = StringIO()
+        call_command('rebuild_shopping_lists', *args, stdout=output)
+        return output.getvalue()
+
+    def test_rebuild_in_batches(self):
+        ShoppingCart.objects.create(user=self.users[1],
+                                    recipe=self.recipes[0])
+        expected = set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'))
+        self.assertIn('Расхождений не найдено', self.call('--check'))
+        ShoppingListItem.objects.filter(user=self.user).update(amount=1)
+        ShoppingListItem.objects.filter(user=self.users[1]).delete()
+        ShoppingListItem.objects.create(user=self.users[2],
+                                        ingredient=self.ingredients[0])
+        self.assertIn('Найдено расхождений', self.call('--check'))
+        self.call('--batch-size', '1')
+        self.assertEqual(set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount')), expected)
+        self.assertIn('Расхождений не найдено',
+                      self.call('--check', '--batch-size', '2'))
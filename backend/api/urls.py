@@ -2,7 +2,8 @@ from django.urls import include, path
 
 from rest_framework.routers import DefaultRouter
 
-from .views import UsersViewSet, TagsViewSet, RecipeViewSet, IngredientsViewSet
+from .views import (IngredientsViewSet, QueryStatsView, RecipeViewSet,
+                    TagsViewSet, UsersViewSet)
 
 
 router_v1 = DefaultRouter()
@@ -15,4 +16,5 @@ router_v1.register('ingredients', IngredientsViewSet, basename='ingredients')
 urlpatterns = [
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('stats/queries/', QueryStatsView.as_view(), name='query-stats'),
 ]
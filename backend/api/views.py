@@ -1,14 +1,26 @@
-from django.http import HttpResponse
+from hashlib import md5
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import F, Sum
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
 
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status, viewsets, mixins
+from rest_framework.views import APIView
 
+from .cache import (INGREDIENTS_VERSION, RECIPE_VERSION, TAGS_VERSION,
+                    USER_FLAGS_VERSION, ConditionalMixin, RecipeCacheMixin,
+                    SnapshotMixin, get_cache_stats, get_version,
+                    ingredients_snapshot, tags_snapshot)
 from .filters import IngredientFilter, RecipeFilterSet
+from .instrumentation import ViewTimingMixin, query_stats
+from .batch import apply_batch, lock_user_relations
+from .pagination import RecipePagination
 from .serializers import (
                         SetPasswordSerializer,
                         UserReadSerializer,
@@ -21,15 +33,31 @@ from .serializers import (
                         RecipeShortSerializer,
                         RecipeCreateSerializer,
                         FavoriteSerializer,
-                        ShoppingCartSerializer
+                        ShoppingCartSerializer,
+                        BatchSerializer
 )
+from .params import SHOPPING_LIST_CHUNK_SIZE
 from .permissions import AuthorOrAdminOrReadOnly, AdminOrReadOnly
+from .renderers import (CSVRenderer, FastJSONRenderer, PDFRenderer,
+                        PlainTextRenderer, ShoppingListNegotiation)
 from users.models import Follow, User
-from recipes.models import (Tag, Ingredient, Recipe, IngredientAmount,
-                            Favorite, ShoppingCart)
+from recipes.models import Tag, Ingredient, Recipe, Favorite, ShoppingCart
+
+
+def batch_response(request, model, field, targets, forbidden=()):
+    """
+    Применяет пакет `add`/`remove` из запроса к связям `model` текущего
+    пользователя и возвращает результат по каждому id.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    results = apply_batch(model, field, request.user, targets,
+                          forbidden=forbidden, **serializer.validated_data)
+    return Response({'results': results}, status=status.HTTP_200_OK)
 
 
-class UsersViewSet(mixins.CreateModelMixin,
+class UsersViewSet(ViewTimingMixin,
+                   mixins.CreateModelMixin,
                    mixins.ListModelMixin,
                    mixins.RetrieveModelMixin,
                    viewsets.GenericViewSet,):
@@ -53,12 +81,29 @@ class UsersViewSet(mixins.CreateModelMixin,
 
     def get_permissions(self):
         if self.action in ['retrieve', 'me', 'set_password', 'subscriptions',
-                           'subscribe']:
+                           'subscribe', 'subscribe_batch']:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
 
+    def prefetch_recipes(self, authors):
+        """
+        Подгружает рецепты авторов одним запросом. Если передан параметр
+        `recipes_limit`, для каждого автора берутся только последние
+        `recipes_limit` рецептов.
+        """
+        queryset = Recipe.objects.filter(author__in=authors).only(
+            'id', 'author', 'name', 'image', 'image_variants', 'cooking_time',
+            'pub_date')
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            queryset = queryset.limit_per_author(int(limit))
+        prefetch_related_objects(
+            authors, Prefetch('recipes', queryset=queryset)
+        )
+        return authors
+
     @action(
         detail=False,
         methods=['GET'],
@@ -85,7 +130,7 @@ class UsersViewSet(mixins.CreateModelMixin,
     def subscriptions(self, request):
         """Список подписок пользователя."""
         queryset = User.objects.filter(following__user=request.user)
-        page = self.paginate_queryset(queryset)
+        page = self.prefetch_recipes(self.paginate_queryset(queryset))
         serializer = FollowSerializer(page, many=True,
                                       context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -94,22 +139,42 @@ class UsersViewSet(mixins.CreateModelMixin,
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, pk):
         """Подписка/отписка текущего пользователя на/от автора."""
-        author = get_object_or_404(User, id=pk)
         if request.method == 'POST':
+            author = get_object_or_404(User, id=pk)
             serializer = FollowUserSerializer(author, data=request.data,
                                               context={'request': request,
                                                        'author': author})
-            serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=request.user, author=author)
+            # Проверка повторной подписки выполняется под блокировкой, иначе
+            # параллельный запрос нарушил бы ограничение уникальности
+            with transaction.atomic():
+                lock_user_relations(request.user)
+                serializer.is_valid(raise_exception=True)
+                Follow.objects.create(user=request.user, author=author)
+            self.prefetch_recipes([author])
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
-        get_object_or_404(Follow, user=request.user,
-                          author=author).delete()
+        author = get_object_or_404(User, id=pk)
+        with transaction.atomic():
+            lock_user_relations(request.user)
+            get_object_or_404(Follow, user=request.user,
+                              author=author).delete()
         return Response({'detail': 'Успешная отписка'},
                         status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['POST'], url_path='subscribe/batch',
+            permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
+        """
+        Пакетная подписка и отписка: {"add": [id, ...], "remove": [...]}.
+        """
+        return batch_response(request, Follow, 'author_id', User.objects.all(),
+                              forbidden=(request.user.pk,))
 
-class TagsViewSet(mixins.ListModelMixin,
+
+class TagsViewSet(ViewTimingMixin,
+                  ConditionalMixin,
+                  SnapshotMixin,
+                  mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   viewsets.GenericViewSet):
     """
@@ -122,9 +187,14 @@ class TagsViewSet(mixins.ListModelMixin,
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
     pagination_class = None
+    snapshot = tags_snapshot
+
+    def get_etag(self, request, *args, **kwargs):
+        return get_version(TAGS_VERSION)
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ViewTimingMixin, ConditionalMixin, SnapshotMixin,
+                         viewsets.ReadOnlyModelViewSet):
     """
     Работает с ингредиентами. Ингредиенты может создавать только администратор.
     _____
@@ -135,14 +205,28 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
     permission_classes = (AdminOrReadOnly,)
-    search_fields = ('^name',)
     pagination_class = None
+    snapshot = ingredients_snapshot
+
+    def get_etag(self, request, *args, **kwargs):
+        return get_version(INGREDIENTS_VERSION)
 
+    def get_snapshot_ids(self, request):
+        """id найденных ингредиентов в порядке выдачи поиска."""
+        if not request.query_params.get(IngredientFilter.search_param):
+            return None
+        found = self.filter_queryset(self.get_queryset())
+        if isinstance(found, QuerySet):
+            return found.values_list('pk', flat=True)
+        return [ingredient.pk for ingredient in found]
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ViewTimingMixin, ConditionalMixin, RecipeCacheMixin,
+                    viewsets.ModelViewSet):
     """Работает с рецептами.
     _____
-    Для всех - вывод списка рецептов, вывод конкретного рецепта.
+    Для всех - вывод списка рецептов, вывод конкретного рецепта
+    (представления рецептов кешируются).
     Для авторизованного пользователя - создание рецепта.
     Для автора/администратора/суперюзера - обновление/удаление рецепта.
     """
@@ -152,6 +236,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_class = RecipeFilterSet
     filterset_class = RecipeFilterSet
     serializer_class = RecipeSerializer
+    pagination_class = RecipePagination
+    conditional_actions = ('retrieve',)
 
     def get_serializer_class(self):
         if self.action in ('favorite', 'shopping_cart'):
@@ -160,10 +246,57 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeCreateSerializer
         return RecipeSerializer
 
+    def get_etag(self, request, pk=None):
+        """
+        Версия рецепта, а для авторизованного пользователя еще и версия его
+        избранного, списка покупок и подписок.
+        """
+        if not str(pk).isdigit():
+            return None
+        keys = [RECIPE_VERSION.format(pk=pk)]
+        if request.user.is_authenticated:
+            keys.append(USER_FLAGS_VERSION.format(pk=request.user.pk))
+        versions = [get_version(key) for key in keys]
+        return md5(repr((
+            request.build_absolute_uri('/'), versions)).encode()).hexdigest()
+
+    def get_last_modified(self, request, pk=None):
+        """
+        Дата изменения рецепта. Для авторизованных пользователей не
+        используется: признаки избранного и подписки меняются без нее.
+        """
+        if request.user.is_authenticated or not str(pk).isdigit():
+            return None
+        return Recipe.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True).first()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """
+        Ошибки выгрузки списка покупок (например, 401 для анонимного
+        пользователя) отдаются в JSON, как и в остальном API, а не в
+        формате файла, выбранном для списка.
+        """
+        if self.action == 'download_shopping_cart' and getattr(
+                response, 'exception', False):
+            request.accepted_renderer = FastJSONRenderer()
+            request.accepted_media_type = FastJSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'list':
+            context['image_width'] = settings.RECIPE_LIST_IMAGE_WIDTH
+        return context
+
     def get_queryset(self):
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Изменяемый рецепт загружается без аннотаций и связанных
+            # объектов: ответ на изменение загружает их заново
+            return Recipe.objects.all()
         user_id = self.request.user.pk
         return Recipe.objects.add_annotations(user_id).select_related(
-            'author').prefetch_related('ingredients', 'tags')
+            'author').prefetch_related('ingredients_amount__ingredient',
+                                       'tags')
 
     @action(
         detail=True,
@@ -178,8 +311,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'recipe': recipe.pk
         }
         serializer = FavoriteSerializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_user_relations(request.user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -187,7 +322,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_favorite(self, request, pk):
         """Удаляет рецепт из `избранное`."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        Favorite.objects.filter(user=request.user, recipe=recipe).delete()
+        with transaction.atomic():
+            lock_user_relations(request.user)
+            Favorite.objects.filter(user=request.user, recipe=recipe).delete()
         message = {'detail': 'Рецепт успешно удален из избранного'}
         return Response(message, status=status.HTTP_204_NO_CONTENT)
 
@@ -204,8 +341,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'recipe': recipe.pk
         }
         serializer = ShoppingCartSerializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_user_relations(request.user)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         serializer = self.get_serializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -213,34 +352,80 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def delete_shopping_cart(self, request, pk):
         """Удаляет рецепт из `мои покупки`."""
         recipe = get_object_or_404(Recipe, pk=pk)
-        ShoppingCart.objects.filter(user=request.user, recipe=recipe).delete()
+        with transaction.atomic():
+            lock_user_relations(request.user)
+            ShoppingCart.objects.filter(
+                user=request.user, recipe=recipe).delete()
         message = {'detail': 'Рецепт успешно удален из списка покупок'}
         return Response(message, status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['POST'], url_path='favorite/batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        """
+        Пакетно добавляет рецепты в избранное и удаляет из него:
+        {"add": [id, ...], "remove": [id, ...]}.
+        """
+        return batch_response(request, Favorite, 'recipe_id',
+                              Recipe.objects.all())
+
+    @action(detail=False, methods=['POST'], url_path='shopping_cart/batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        """
+        Пакетно добавляет рецепты в список покупок и удаляет из него:
+        {"add": [id, ...], "remove": [id, ...]}.
+        """
+        return batch_response(request, ShoppingCart, 'recipe_id',
+                              Recipe.objects.all())
+
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer),
+        content_negotiation_class=ShoppingListNegotiation,
     )
     def download_shopping_cart(self, request):
-        """Загружает файл *.txt со списком покупок. Считает сумму ингредиентов
-         в рецептах выбранных для покупки. Возвращает текстовый файл со списком
-         ингредиентов."""
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=request.user).values(
-            name=F('ingredient__name'),
-            measurement_unit=F('ingredient__measurement_unit')).annotate(
-            amount=Sum('amount')
+        """Загружает файл со списком покупок в формате из параметра `format`
+         (txt, csv или pdf). Сумма ингредиентов в рецептах выбранных для
+         покупки берется из заранее посчитанного списка покупок. Строки
+         читаются серверным курсором и отдаются клиенту по мере готовности."""
+        ingredients = request.user.shopping_list.values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit'
+        ).order_by('ingredient__name').iterator(
+            chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=renderer.media_type
         )
-        data = []
-        for ingredient in ingredients:
-            data.append(
-                f'{ingredient["name"]} - '
-                f'{ingredient["amount"]} '
-                f'{ingredient["measurement_unit"]}'
-            )
-        content = 'Список покупок:\n\n' + '\n'.join(data)
-        filename = 'shopping_cart.txt'
-        request = HttpResponse(content, content_type='text/plain')
-        request['Content-Disposition'] = f'attachment; filename={filename}'
-        return request
+        response['Content-Disposition'] = (
+            f'attachment; filename={renderer.filename}')
+        return response
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAdminUser,)
+    )
+    def cache_stats(self, request):
+        """Статистика попаданий в кеш ответов с рецептами."""
+        return Response(get_cache_stats(), status=status.HTTP_200_OK)
+
+
+class QueryStatsView(APIView):
+    """
+    Статистика SQL-запросов и времени ответа по представлениям
+    текущего процесса (QueryBudgetMiddleware). Только для администратора.
+    _____
+    GET - вывод статистики, DELETE - сброс.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(query_stats.get(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        query_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +72,16 @@ DATABASES = {
     }
 }
 
+# Локальный запуск без PostgreSQL (например, для бенчмарков): DB_ENGINE=sqlite3
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH',
+                              os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -102,6 +114,26 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# По-умолчанию файловый кеш: он общий для всех воркеров на одном сервере,
+# без общего кеша не работают кеш ответов, ETag и кеш токенов
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    }
+}
+# Максимальное количество записей для файлового и локального кеша
+if os.getenv('CACHE_MAX_ENTRIES'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES')),
+    }
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -111,9 +143,13 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     "DEFAULT_PAGINATION_CLASS": "api.pagination.PageLimitPagination",
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -134,3 +170,48 @@ DJOSER = {
 }
 
 DATA_ROOT = os.path.join(BASE_DIR, 'data')
+
+# Поиск ингредиентов: 'database' - запросом к БД по индексам pg_trgm,
+# 'trie' - по префиксному дереву в памяти процесса
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', 'database')
+# Время жизни префиксного дерева ингредиентов в секундах
+INGREDIENT_TRIE_TIMEOUT = int(os.getenv('INGREDIENT_TRIE_TIMEOUT', 300))
+# Максимальное время жизни снимков таблиц (теги, ингредиенты) в памяти
+# процесса в секундах: без общего кеша изменения из других процессов
+# подхватываются только по его истечении
+SNAPSHOT_TIMEOUT = int(os.getenv('SNAPSHOT_TIMEOUT', 60))
+# Время кеширования общего количества рецептов для пагинации в секундах
+RECIPE_COUNT_CACHE_TIMEOUT = int(os.getenv('RECIPE_COUNT_CACHE_TIMEOUT', 60))
+# Время кеширования ответов с рецептами для анонимных пользователей
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+# Период полураспада веса добавлений в избранное и список покупок
+# для сортировки trending, в часах
+TRENDING_HALF_LIFE = float(os.getenv('TRENDING_HALF_LIFE', 72))
+# Ширины уменьшенных копий фото рецептов в пикселях, через пробел
+RECIPE_IMAGE_WIDTHS = tuple(sorted(
+    int(width)
+    for width in os.getenv('RECIPE_IMAGE_WIDTHS', '320 640 1280').split()
+))
+# Формат уменьшенных копий: WEBP или JPEG
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', 'WEBP').upper()
+# Количество потоков обработки фото, 0 - обработка сразу после сохранения
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+# Ширина фото в списке рецептов
+RECIPE_LIST_IMAGE_WIDTH = int(os.getenv('RECIPE_LIST_IMAGE_WIDTH', 640))
+# Количество токенов в кеше аутентификации каждого процесса
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+# Время кеширования пользователя по токену в секундах. Кеш работает только
+# с общим бэкендом кеша (CACHE_BACKEND, не LocMemCache), иначе выход и смена
+# пароля не доходили бы до других процессов
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 60))
+# Хранить пользователей по токенам еще и в общем кеше Django
+TOKEN_CACHE_SHARED = (os.getenv('TOKEN_CACHE_SHARED', 'False') == 'True')
+# Учет SQL-запросов и времени ответа по представлениям
+# (по-умолчанию включен в режиме отладки)
+QUERY_INSTRUMENTATION = (
+    os.getenv('QUERY_INSTRUMENTATION', str(DEBUG)) == 'True'
+)
+# Сколько одинаковых запросов за один ответ считать признаком N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+# Кодировщик ответов JSON: orjson (если установлен) или json
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'orjson')
@@ -4,7 +4,7 @@ from django.contrib import admin
 from dotenv import load_dotenv
 
 from .models import (Tag, IngredientAmount, Ingredient, Recipe, Favorite,
-                     ShoppingCart)
+                     ShoppingCart, ShoppingListItem)
 from api.params import MIN_AMOUNT_INGREDIENTS, MAX_AMOUNT_INGREDIENTS
 
 load_dotenv()
@@ -45,9 +45,10 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = os.getenv('VALUE_DISPLAY', '---')
 
     def count_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     count_favorites.short_description = "Добавлено в избранное"
+    count_favorites.admin_order_field = 'favorites_count'
 
 
 @admin.register(Favorite)
@@ -68,6 +69,14 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     empty_value_display = os.getenv('VALUE_DISPLAY', '---')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Отображает списки покупок пользователей в панели администратора."""
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    search_fields = ('user__username',)
+    list_select_related = ('user', 'ingredient')
+
+
 @admin.register(IngredientAmount)
 class IngredientAmountAdmin(admin.ModelAdmin):
     """Отображает количество игредиентов в рецептах в панели администратора."""
@@ -0,0 +1,190 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .storage import lock_file_name
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_PATH = 'recipes/variants/'
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+QUALITY = 80
+
+_executor = None
+_executor_lock = Lock()
+
+
+def variant_name(image_name, width):
+    """
+    Имя файла уменьшенной копии изображения `image_name`. Хранилище фото
+    заменяет его на хеш содержимого, сохраняя каталог и расширение.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    extension = FORMAT_EXTENSIONS[settings.RECIPE_IMAGE_FORMAT]
+    return f'{VARIANTS_PATH}{stem}-{width}.{extension}'
+
+
+def parse_image_variants(image_name, variants):
+    """
+    Возвращает словарь {ширина: имя файла} уменьшенных копий изображения
+    `image_name` по значению поля image_variants. Пустой словарь - копии
+    еще не построены.
+    """
+    variants = variants or {}
+    if not image_name or variants.get('source') != image_name:
+        return {}
+    return {int(width): name for width, name in variants['widths'].items()}
+
+
+def get_image_variants(recipe):
+    """Уменьшенные копии текущего изображения рецепта."""
+    return parse_image_variants(recipe.image.name, recipe.image_variants)
+
+
+def get_image_variant(recipe, width):
+    """
+    Имя наименьшей уменьшенной копии шириной не меньше `width`, а если
+    таких нет - наибольшей. None, если копии еще не построены.
+    """
+    return choose_image_variant(get_image_variants(recipe), width)
+
+
+def choose_image_variant(variants, width):
+    """Выбирает копию для get_image_variant из словаря {ширина: имя}."""
+    if not variants:
+        return None
+    suitable = [key for key in variants if key >= width] or [max(variants)]
+    return variants[min(suitable)]
+
+
+def encode_image(image, width):
+    """Уменьшает изображение до ширины `width` и кодирует без метаданных."""
+    if width < image.width:
+        height = max(round(image.height * width / image.width), 1)
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, settings.RECIPE_IMAGE_FORMAT, quality=QUALITY)
+    return buffer.getvalue()
+
+
+def build_image_variants(recipe_id):
+    """
+    Строит уменьшенные копии изображения рецепта шириной
+    RECIPE_IMAGE_WIDTHS (не шире исходного), учитывая ориентацию из EXIF
+    и отбрасывая метаданные. Файлы предыдущего фото удаляются через
+    release_image.
+    """
+    from api.cache import invalidate_recipes
+
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'image', 'image_variants').first()
+    if recipe is None or not recipe.image or get_image_variants(recipe):
+        return
+    source = recipe.image.name
+    storage = recipe.image.storage
+    try:
+        with recipe.image.open('rb') as file, Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands()
+                and settings.RECIPE_IMAGE_FORMAT == 'WEBP' else 'RGB'
+            )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception('Не удалось обработать изображение %s', source)
+        return
+    encoded = {}
+    for width in settings.RECIPE_IMAGE_WIDTHS:
+        target = min(width, image.width)
+        if target not in encoded:
+            encoded[target] = encode_image(image, target)
+    # Копии сохраняются в одной транзакции с обновлением рецепта, чтобы
+    # release_image и collect_media не удалили их до фиксации ссылок
+    with transaction.atomic():
+        names = {
+            target: storage.save(variant_name(source, target),
+                                 ContentFile(content))
+            for target, content in encoded.items()
+        }
+        widths = {
+            str(width): names[min(width, image.width)]
+            for width in settings.RECIPE_IMAGE_WIDTHS
+        }
+        updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_variants={'source': source, 'widths': widths})
+    if updated:
+        invalidate_recipes((recipe_id,))
+
+
+def is_file_referenced(name):
+    """Ссылается ли хотя бы один рецепт на файл как на фото или его копию."""
+    return Recipe.objects.filter(
+        Q(image=name) | Q(image_variants__icontains=name)).exists()
+
+
+def release_image(name, variants):
+    """
+    Удаляет файл фото и его уменьшенные копии, если на них больше не
+    ссылается ни один рецепт. Одинаковые фото хранятся одним файлом,
+    поэтому количество ссылок - число рецептов с этим фото. Ссылки
+    проверяются под lock_file_name, поэтому фото, которое параллельно
+    переиспользует сохраняемый рецепт, не удаляется.
+    """
+    if not name:
+        return
+    storage = Recipe._meta.get_field('image').storage
+    names = [name]
+    if (variants or {}).get('source') == name:
+        names.extend(sorted(set(variants['widths'].values())))
+    with transaction.atomic():
+        for file_name in names:
+            lock_file_name(file_name)
+        if Recipe.objects.filter(image=name).exists():
+            return
+        for file_name in names:
+            if file_name == name or not is_file_referenced(file_name):
+                storage.delete(file_name)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return _executor
+
+
+def run_in_thread(recipe_id):
+    close_old_connections()
+    try:
+        build_image_variants(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_variants(recipe_id):
+    """
+    После фиксации транзакции ставит построение копий изображения в
+    очередь пула потоков. При RECIPE_IMAGE_WORKERS = 0 копии строятся
+    сразу в текущем потоке.
+    """
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(run_in_thread, recipe_id)
+        else:
+            build_image_variants(recipe_id)
+
+    transaction.on_commit(submit)
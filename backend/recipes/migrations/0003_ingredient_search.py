@@ -0,0 +1,43 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+INDEXES = (
+    ('recipes_ingredient_name_upper_pattern',
+     'btree (UPPER("name"::text) varchar_pattern_ops)'),
+    ('recipes_ingredient_name_upper_trgm',
+     'gin (UPPER("name"::text) gin_trgm_ops)'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """
+    Индексы для поиска без учета регистра: Django строит istartswith и
+    icontains как UPPER("name") LIKE UPPER(...). Выражения с классами
+    операторов доступны только в PostgreSQL.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, definition in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" '
+            f'ON "recipes_ingredient" USING {definition}'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_shopping_list'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
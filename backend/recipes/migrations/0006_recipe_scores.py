@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество добавлений в избранное и в список покупок', verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending',
+            field=models.FloatField(default=0, editable=False, help_text='Количество добавлений в избранное и в список покупок с затуханием по времени', verbose_name='Набирает популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending', '-id'], name='recipe_trending_id_idx'),
+        ),
+    ]
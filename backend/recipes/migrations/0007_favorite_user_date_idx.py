@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-date_added'], include=('recipe',), name='favorite_user_date_idx'),
+        ),
+    ]
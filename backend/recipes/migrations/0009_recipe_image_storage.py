@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:40
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Фото блюда', storage=recipes.storage.HashedFileSystemStorage(), upload_to='recipes/images/', verbose_name='Фото'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:10
+
+from django.db import migrations
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def fill_shopping_lists(apps, schema_editor):
+    """
+    Заполняет списки покупок по корзинам, существовавшим до появления
+    ShoppingListItem. Списки считаются заново, поэтому повторный запуск
+    (в том числе после rebuild_shopping_lists) дает тот же результат.
+    """
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    totals = IngredientAmount.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=total)
+            for user_id, ingredient_id, total in totals
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
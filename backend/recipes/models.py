@@ -1,5 +1,6 @@
-from django.db import models
-from django.db.models.functions import Length
+from django.db import models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Length, RowNumber
 from django.core.validators import (MinValueValidator,
                                     RegexValidator,
                                     MaxValueValidator)
@@ -9,6 +10,7 @@ from api.params import (MIN_COOKING_TIME,
                         MAX_COOKING_TIME,
                         MIN_AMOUNT_INGREDIENTS,
                         MAX_AMOUNT_INGREDIENTS)
+from .storage import recipe_image_storage
 
 models.CharField.register_lookup(Length)
 
@@ -108,6 +110,26 @@ class QuerySet(models.QuerySet):
             ),
         )
 
+    def limit_per_author(self, limit):
+        """
+        Оставляет не более `limit` последних рецептов каждого автора.
+        Нумерация строк выполняется оконной функцией во вложенном запросе,
+        так как Django не позволяет фильтровать по Window напрямую.
+        """
+        ranked = self.annotate(
+            row_number=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author_id'),
+                order_by=(models.F('pub_date').desc(), models.F('pk').desc()),
+            )
+        ).values('pk', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT "ranked"."id" FROM ({sql}) AS "ranked" '
+            'WHERE "ranked"."row_number" <= %s',
+            (*params, limit),
+        ))
+
 
 class Recipe(models.Model):
     """Модель рецептов."""
@@ -126,9 +148,16 @@ class Recipe(models.Model):
     image = models.ImageField(
         blank=True,
         upload_to='recipes/images/',
+        storage=recipe_image_storage,
         help_text='Фото блюда',
         verbose_name='Фото'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии фото',
+    )
     text = models.TextField(
         verbose_name='Описание',
         help_text='Описание рецепта'
@@ -164,13 +193,49 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлено в избранное',
+    )
+    popularity = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность',
+        help_text='Количество добавлений в избранное и в список покупок',
+    )
+    trending = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Набирает популярность',
+        help_text='Количество добавлений в избранное и в список покупок '
+                  'с затуханием по времени',
+    )
 
     objects = QuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('-popularity', '-id'),
+                name='recipe_popularity_id_idx',
+            ),
+            models.Index(
+                fields=('-trending', '-id'),
+                name='recipe_trending_id_idx',
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('name', 'author'),
@@ -256,6 +321,13 @@ class Favorite(models.Model):
         ordering = ('user',)
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
+        indexes = (
+            models.Index(
+                fields=('user', '-date_added'),
+                include=('recipe',),
+                name='favorite_user_date_idx',
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'recipe'),
@@ -295,3 +367,112 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             ),
         )
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """Операции над агрегированными списками покупок."""
+
+    def apply_amounts(self, user_ids, amounts):
+        """
+        Прибавляет к спискам покупок пользователей `user_ids` количества
+        ингредиентов из словаря {id ингредиента: изменение}. Отрицательные
+        значения уменьшают количество, опустевшие позиции удаляются.
+        """
+        amounts = {key: value for key, value in amounts.items() if value}
+        user_ids = list(user_ids)
+        if not amounts or not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(user_id=user_id, ingredient_id=ingredient_id)
+                    for user_id in user_ids
+                    for ingredient_id, amount in amounts.items()
+                    if amount > 0
+                ],
+                ignore_conflicts=True,
+            )
+            items = self.filter(user_id__in=user_ids,
+                                ingredient_id__in=amounts)
+            items.update(amount=models.F('amount') + models.Case(
+                *(models.When(ingredient_id=ingredient_id, then=amount)
+                  for ingredient_id, amount in amounts.items()),
+                default=0,
+                output_field=models.IntegerField(),
+            ))
+            items.filter(amount__lte=0).delete()
+
+    def calculate(self, user_ids):
+        """
+        Считает списки покупок пользователей `user_ids` заново по содержимому
+        корзин. Возвращает словарь
+        {(id пользователя, id ингредиента): количество}.
+        """
+        totals = IngredientAmount.objects.filter(
+            recipe__shopping_cart__user__in=user_ids
+        ).values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+        return {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in totals
+        }
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель агрегированного списка покупок: суммарное количество каждого
+    ингредиента по всем рецептам в корзине пользователя.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('user', 'ingredient')
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.amount}'
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        """Возвращает словарь {id ингредиента: количество} для рецепта."""
+        return dict(
+            IngredientAmount.objects.filter(recipe_id=recipe_id)
+            .values_list('ingredient_id', 'amount').order_by()
+        )
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        """
+        Возвращает словарь {id ингредиента: суммарное количество} для
+        нескольких рецептов.
+        """
+        return dict(
+            IngredientAmount.objects.filter(recipe_id__in=recipe_ids)
+            .values('ingredient_id').annotate(total=models.Sum('amount'))
+            .values_list('ingredient_id', 'total').order_by()
+        )
@@ -0,0 +1,284 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from api.batch import relations_added, relations_removed
+from api.cache import (INGREDIENTS_VERSION, USER_FLAGS_VERSION,
+                       invalidate_recipes, invalidate_version, tag_table)
+from api.search import invalidate_ingredient_trie
+from users.models import User
+from .images import (get_image_variants, release_image,
+                     schedule_image_variants)
+from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                     ShoppingCart, ShoppingListItem, Tag)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_ingredient_trie(sender, **kwargs):
+    """
+    Сбрасывает префиксное дерево поиска и версию списка ингредиентов
+    после изменения ингредиентов.
+    """
+    invalidate_ingredient_trie()
+    invalidate_version(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в список покупок пользователя."""
+    if created:
+        ShoppingListItem.objects.apply_amounts(
+            (instance.user_id,),
+            ShoppingListItem.recipe_amounts(instance.recipe_id),
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """
+    Вычитает ингредиенты рецепта из списка покупок пользователя.
+    Используется pre_delete, чтобы при каскадном удалении рецепта его
+    ингредиенты еще были доступны.
+    """
+    amounts = ShoppingListItem.recipe_amounts(instance.recipe_id)
+    ShoppingListItem.objects.apply_amounts(
+        (instance.user_id,),
+        {key: -value for key, value in amounts.items()},
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reset_recipe_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш ответов после изменения рецепта."""
+    invalidate_recipes((instance.pk,))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def reset_recipe_ingredients_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш ответов после изменения ингредиентов рецепта."""
+    invalidate_recipes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def reset_recipe_tags_cache(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """Сбрасывает кеш ответов после изменения тегов рецепта."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_recipes((instance.pk,))
+    elif action == 'pre_clear':
+        invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+    else:
+        invalidate_recipes(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def reset_related_recipes_cache(sender, instance, created=False, **kwargs):
+    """
+    Сбрасывает кеш ответов и обновляет дату изменения (Last-Modified)
+    рецептов с измененным тегом или ингредиентом. При удалении связи еще
+    доступны в pre_delete.
+    """
+    if created:
+        return
+    invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+    instance.recipes.update(updated_at=timezone.now())
+
+
+# Поля автора, которые входят в представление рецепта
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_author_profile(sender, instance, update_fields, **kwargs):
+    """Запоминает поля автора, чтобы после сохранения найти изменения."""
+    instance._previous_profile = None
+    if instance.pk is None or (
+            update_fields and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    instance._previous_profile = User.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def reset_author_recipes_cache(sender, instance, created, **kwargs):
+    """
+    Сбрасывает кеш ответов и обновляет дату изменения рецептов автора,
+    если изменились поля автора из представления рецепта.
+    """
+    previous = getattr(instance, '_previous_profile', None)
+    instance._previous_profile = None
+    profile = tuple(getattr(instance, field) for field in AUTHOR_FIELDS)
+    if created or previous is None or previous == profile:
+        return
+    invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+    instance.recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик добавлений рецепта в избранное."""
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    """Уменьшает счетчик добавлений рецепта в избранное."""
+    Recipe.objects.filter(pk=instance.recipe_id, favorites_count__gt=0).update(
+        favorites_count=F('favorites_count') - 1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик рецептов автора."""
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    """Уменьшает счетчик рецептов автора."""
+    User.objects.filter(pk=instance.author_id, recipes_count__gt=0).update(
+        recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_popularity(sender, instance, created, **kwargs):
+    """
+    Учитывает новое добавление рецепта в избранное или список покупок.
+    Вес нового события для trending равен 1, затухание со временем
+    пересчитывается командой update_recipe_scores.
+    """
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            popularity=F('popularity') + 1,
+            trending=F('trending') + 1,
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_popularity(sender, instance, **kwargs):
+    """
+    Учитывает удаление рецепта из избранного или списка покупок.
+    trending после затухания может быть меньше 1, поэтому оба счетчика
+    ограничиваются снизу нулем.
+    """
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        popularity=Greatest(F('popularity') - 1, 0),
+        trending=Greatest(F('trending') - 1, 0.0),
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_tag_table(sender, **kwargs):
+    """Сбрасывает таблицу тегов в памяти процессов."""
+    tag_table.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    """Ставит в очередь построение уменьшенных копий нового фото рецепта."""
+    if instance.image and not get_image_variants(instance):
+        schedule_image_variants(instance.pk)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(sender, instance, update_fields, **kwargs):
+    """Запоминает прежнее фото рецепта, чтобы освободить его после замены."""
+    if instance.pk is None or (update_fields and 'image' not in update_fields):
+        return
+    instance._previous_image = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', 'image_variants').first()
+
+
+@receiver(post_save, sender=Recipe)
+def release_previous_image(sender, instance, **kwargs):
+    """Удаляет замененное фото, если на него не ссылаются другие рецепты."""
+    previous = getattr(instance, '_previous_image', None)
+    instance._previous_image = None
+    if previous and previous[0] != instance.image.name:
+        transaction.on_commit(lambda: release_image(*previous))
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """Удаляет фото удаленного рецепта, если оно больше не используется."""
+    name, variants = instance.image.name, instance.image_variants
+    transaction.on_commit(lambda: release_image(name, variants))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def reset_user_flags_version(sender, instance, **kwargs):
+    """Сбрасывает версию избранного и списка покупок пользователя."""
+    invalidate_version(USER_FLAGS_VERSION.format(pk=instance.user_id))
+
+
+@receiver(relations_added, sender=Favorite)
+@receiver(relations_added, sender=ShoppingCart)
+def increment_batch_counters(sender, ids, **kwargs):
+    """
+    Пакетный аналог increment_favorites_count и increment_popularity:
+    учитывает добавление рецептов `ids` в избранное или список покупок.
+    """
+    counters = {'popularity': F('popularity') + 1,
+                'trending': F('trending') + 1}
+    if sender is Favorite:
+        counters['favorites_count'] = F('favorites_count') + 1
+    Recipe.objects.filter(pk__in=ids).update(**counters)
+
+
+@receiver(relations_removed, sender=Favorite)
+@receiver(relations_removed, sender=ShoppingCart)
+def decrement_batch_counters(sender, ids, **kwargs):
+    """
+    Пакетный аналог decrement_favorites_count и decrement_popularity.
+    """
+    counters = {'popularity': Greatest(F('popularity') - 1, 0),
+                'trending': Greatest(F('trending') - 1, 0.0)}
+    if sender is Favorite:
+        counters['favorites_count'] = Greatest(F('favorites_count') - 1, 0)
+    Recipe.objects.filter(pk__in=ids).update(**counters)
+
+
+@receiver(relations_added, sender=ShoppingCart)
+def add_batch_to_shopping_list(sender, user_id, ids, **kwargs):
+    """Добавляет ингредиенты рецептов `ids` в список покупок."""
+    ShoppingListItem.objects.apply_amounts(
+        (user_id,), ShoppingListItem.recipes_amounts(ids))
+
+
+@receiver(relations_removed, sender=ShoppingCart)
+def remove_batch_from_shopping_list(sender, user_id, ids, **kwargs):
+    """Вычитает ингредиенты рецептов `ids` из списка покупок."""
+    amounts = ShoppingListItem.recipes_amounts(ids)
+    ShoppingListItem.objects.apply_amounts(
+        (user_id,), {key: -value for key, value in amounts.items()})
+
+
+@receiver(relations_added, sender=Favorite)
+@receiver(relations_removed, sender=Favorite)
+@receiver(relations_added, sender=ShoppingCart)
+@receiver(relations_removed, sender=ShoppingCart)
+def reset_batch_user_flags_version(sender, user_id, **kwargs):
+    """Сбрасывает версию избранного и списка покупок пользователя."""
+    invalidate_version(USER_FLAGS_VERSION.format(pk=user_id))
@@ -0,0 +1,60 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+
+def lock_file_name(name):
+    """
+    Блокирует имя файла до конца текущей транзакции (advisory-блокировка
+    PostgreSQL). Под этой блокировкой файл записывается или переиспользуется
+    при сохранении рецепта и удаляется после проверки ссылок на него,
+    поэтому файл не удаляется, пока ссылающийся на него рецепт еще не
+    сохранен. В других СУБД блокировка не выполняется.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - SHA-256 его содержимого.
+    Одинаковые файлы хранятся один раз: если файл с таким содержимым уже
+    есть, повторная запись не выполняется и возвращается его имя.
+    Содержимое файла по имени никогда не меняется, поэтому файлы можно
+    кешировать бессрочно.
+    Файл записывается под lock_file_name, поэтому сохранять его нужно в
+    той же транзакции, что и ссылающийся на него рецепт.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = digest.hexdigest()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        lock_file_name(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+recipe_image_storage = HashedFileSystemStorage()
@@ -12,7 +12,7 @@ load_dotenv()
 class UserAdmin(admin.ModelAdmin):
     """Отображает пользователей в панели администратора."""
     list_display = ('username', 'first_name', 'last_name', 'email',
-                    'role')
+                    'role', 'recipes_count', 'followers_count')
     list_filter = ('email', 'username', )
     empty_value_display = os.getenv('VALUE_DISPLAY', '---')
 
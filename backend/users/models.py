@@ -31,6 +31,16 @@ class User(AbstractUser):
         max_length=10,
         verbose_name='Уровень доступа пользователей',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     @property
     def is_admin(self):
@@ -0,0 +1,74 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.batch import relations_added, relations_removed
+from api.cache import (USER_FLAGS_VERSION, USER_TOKENS_VERSION,
+                       invalidate_version)
+
+from .models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def increment_followers_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик подписчиков автора."""
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            followers_count=F('followers_count') + 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_followers_count(sender, instance, **kwargs):
+    """Уменьшает счетчик подписчиков автора."""
+    User.objects.filter(pk=instance.author_id, followers_count__gt=0).update(
+        followers_count=F('followers_count') - 1)
+
+
+@receiver(relations_added, sender=Follow)
+def increment_batch_followers_count(sender, ids, **kwargs):
+    """Увеличивает счетчики подписчиков авторов `ids`."""
+    User.objects.filter(pk__in=ids).update(
+        followers_count=F('followers_count') + 1)
+
+
+@receiver(relations_removed, sender=Follow)
+def decrement_batch_followers_count(sender, ids, **kwargs):
+    """Уменьшает счетчики подписчиков авторов `ids`."""
+    User.objects.filter(pk__in=ids).update(
+        followers_count=Greatest(F('followers_count') - 1, 0))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_user_flags_version(sender, instance, **kwargs):
+    """Сбрасывает версию подписок пользователя."""
+    invalidate_version(USER_FLAGS_VERSION.format(pk=instance.user_id))
+
+
+@receiver(relations_added, sender=Follow)
+@receiver(relations_removed, sender=Follow)
+def reset_batch_user_flags_version(sender, user_id, **kwargs):
+    """Сбрасывает версию подписок пользователя после пакетных изменений."""
+    invalidate_version(USER_FLAGS_VERSION.format(pk=user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_user_token_cache(sender, instance, created=False,
+                           update_fields=None, **kwargs):
+    """
+    Сбрасывает кеш аутентификации пользователя после его изменения,
+    в том числе смены пароля, и удаления.
+    """
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_version(USER_TOKENS_VERSION.format(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def reset_token_cache(sender, instance, **kwargs):
+    """Сбрасывает кеш аутентификации после выхода пользователя."""
+    invalidate_version(USER_TOKENS_VERSION.format(pk=instance.user_id))